@@ -252,9 +252,10 @@ async def match_pdf_to_ebook(pdf_name):
         if not ebook:
             # Try partial match
             clean_name = pdf_name.lower().replace('.pdf', '').replace('-', ' ').replace('_', ' ')
-            ebooks = await db.ebooks.find().to_list(100)
-            
-            for eb in ebooks:
+            # stream seluruh katalog (bukan to_list(100) yang memotong), cukup field yang dipakai
+            async for eb in db.ebooks.find({}, {"_id": 0, "id": 1, "title": 1, "fileName": 1}):
+                if not eb.get('fileName'):
+                    continue
                 eb_clean = eb['fileName'].lower().replace('.pdf', '').replace('-', ' ').replace('_', ' ')
                 if clean_name in eb_clean or eb_clean in clean_name:
                     return eb['id'], eb['title']
@@ -0,0 +1,78 @@
+"""
+Resend "order paid" emails for every SUCCESS order in a time window
+Use after rotating driveDownloadLink / file_url values.
+
+Examples:
+    python resend_order_emails.py --job links-2025-06 --since 2025-01-01 --until 2025-06-01
+    python resend_order_emails.py --job links-2025-06              # resume after interruption
+    python resend_order_emails.py --job links-2025-06 --dry-run    # count only, no emails
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from services.bulk_resend import RESEND_BATCH_SIZE, RESEND_CONCURRENCY, RESEND_RATE_PER_SECOND, resend_order_emails
+from services.mail_transport import close_all_transports
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+db_name = os.environ['DB_NAME']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--job", required=True, help="Job id; reuse it to resume from the checkpoint")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Orders created at/after (ISO date, UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Orders created before (ISO date, UTC)")
+    parser.add_argument("--batch-size", type=int, default=RESEND_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=RESEND_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=RESEND_RATE_PER_SECOND, help="Max emails per second")
+    parser.add_argument("--dry-run", action="store_true", help="Walk the orders without sending")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        print(f"📧 Resend job '{args.job}' starting...")
+        result = await resend_order_emails(
+            db,
+            args.job,
+            since=args.since,
+            until=args.until,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            rate_per_second=args.rate,
+            dry_run=args.dry_run,
+            restart=args.restart,
+        )
+        print(
+            f"✅ Done: sent={result['sent']} would_send={result.get('would_send', 0)} "
+            f"failed={result['failed']} skipped={result['skipped']}"
+        )
+        if result.get("failedOrderIds"):
+            print(f"⚠️ Failed orders: {', '.join(map(str, result['failedOrderIds']))}")
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print(f"⏸️ Interrupted, rerun with --job {args.job} to resume")
+    except Exception as e:
+        print(f"❌ Resend failed: {str(e)}")
+    finally:
+        await close_all_transports()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,35 @@
 from fastapi import APIRouter, HTTPException
 from motor.motor_asyncio import AsyncIOMotorClient
+import hmac
 import os
 from dotenv import load_dotenv
 import subprocess
 import sys
+from datetime import datetime
+from typing import Optional
+
+from services.catalog_cache import catalog_cache
 
 load_dotenv()
 
 router = APIRouter()
 
+# secret query param untuk aksi admin yang sensitif; tanpa ADMIN_SECRET semua ditolak
+ADMIN_SECRET = os.environ.get("ADMIN_SECRET")
+
+
+def _admin_secret_ok(secret: Optional[str]) -> bool:
+    return bool(ADMIN_SECRET and secret) and hmac.compare_digest(
+        secret.encode("utf-8"), ADMIN_SECRET.encode("utf-8")
+    )
+
+
+def _require_admin_secret(secret: Optional[str]) -> None:
+    if not ADMIN_SECRET:
+        raise HTTPException(status_code=503, detail="Admin secret is not configured")
+    if not _admin_secret_ok(secret):
+        raise HTTPException(status_code=403, detail="Invalid admin secret")
+
 @router.post("/admin/fix-thumbnails-direct")
 async def fix_thumbnails_directly():
     """
@@ -73,6 +94,7 @@ async def fix_thumbnails_directly():
         has_image_after = bool(sample_after and sample_after.get("pages") and len(sample_after["pages"]) > 0 and sample_after["pages"][0].get("imageUrl"))
         
         client.close()
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -110,6 +132,7 @@ async def fix_production_thumbnails():
             text=True,
             cwd='/app/backend'
         )
+        catalog_cache.invalidate()
         
         # Check if script ran successfully
         if result.returncode != 0:
@@ -202,6 +225,7 @@ async def update_minigames_thumbnails():
         sample = await db.minigames.find_one({"id": 1})
         
         client.close()
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -322,6 +346,7 @@ async def seed_exclusive_ebooks_direct():
         count = await db.exclusive_ebooks.count_documents({})
         
         client.close()
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -371,6 +396,7 @@ async def force_update_minigames():
         )
         
         client.close()
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -387,39 +413,22 @@ async def clear_and_reseed_database():
     Clear ALL data and reseed from scratch
     USE WITH CAUTION - This will delete all data!
     """
+    from server import db
+    from services.seeding import seed_catalog
+
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
     try:
-        mongo_url = os.environ.get('MONGO_URL')
-        db_name = os.environ.get('DB_NAME', 'pelangi_pintar')
-        
-        client = AsyncIOMotorClient(mongo_url)
-        db = client[db_name]
-        
+        seeded = await seed_catalog(db, replace=True)
+        failed = {name: r["error"] for name, r in seeded.items() if r["status"] == "error"}
+        if failed:
+            raise RuntimeError(failed)
+
         results = {
-            "deleted": {},
-            "seeded": {}
+            "deleted": {name: r["deleted"] for name, r in seeded.items()},
+            "seeded": {name: r["inserted"] for name, r in seeded.items()},
         }
-        
-        # Delete all data
-        results["deleted"]["ebooks"] = (await db.ebooks.delete_many({})).deleted_count
-        results["deleted"]["minigames"] = (await db.minigames.delete_many({})).deleted_count
-        results["deleted"]["exclusive_ebooks"] = (await db.exclusive_ebooks.delete_many({})).deleted_count
-        
-        client.close()
-        
-        # Run seed scripts
-        subprocess.run([sys.executable, '/app/backend/seed_db.py'], cwd='/app/backend')
-        subprocess.run([sys.executable, '/app/backend/seed_minigames.py'], cwd='/app/backend')
-        subprocess.run([sys.executable, '/app/backend/seed_exclusive_ebooks.py'], cwd='/app/backend')
-        
-        # Get new counts
-        client = AsyncIOMotorClient(mongo_url)
-        db = client[db_name]
-        
-        results["seeded"]["ebooks"] = await db.ebooks.count_documents({})
-        results["seeded"]["minigames"] = await db.minigames.count_documents({})
-        results["seeded"]["exclusive_ebooks"] = await db.exclusive_ebooks.count_documents({})
-        
-        client.close()
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -437,63 +446,23 @@ async def seed_all_collections():
     Admin endpoint to seed ALL collections in production database
     Seeds: ebooks, mini-games, and exclusive ebooks
     """
+    from server import db
+    from services.seeding import seed_catalog
+
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
     try:
-        mongo_url = os.environ.get('MONGO_URL')
-        db_name = os.environ.get('DB_NAME', 'pelangi_pintar')
-        
-        client = AsyncIOMotorClient(mongo_url)
-        db = client[db_name]
-        
-        results = {
-            "ebooks": {"before": 0, "after": 0},
-            "minigames": {"before": 0, "after": 0},
-            "exclusive_ebooks": {"before": 0, "after": 0}
-        }
-        
-        # Get current counts
-        results["ebooks"]["before"] = await db.ebooks.count_documents({})
-        results["minigames"]["before"] = await db.minigames.count_documents({})
-        results["exclusive_ebooks"]["before"] = await db.exclusive_ebooks.count_documents({})
-        
-        # 1. Seed main ebooks
-        print("Seeding ebooks...")
-        result = subprocess.run(
-            [sys.executable, '/app/backend/seed_db.py'],
-            capture_output=True,
-            text=True,
-            cwd='/app/backend'
-        )
-        if result.returncode != 0:
-            print(f"Ebook seeding warning: {result.stderr}")
-        
-        # 2. Seed mini-games
-        print("Seeding mini-games...")
-        result = subprocess.run(
-            [sys.executable, '/app/backend/seed_minigames.py'],
-            capture_output=True,
-            text=True,
-            cwd='/app/backend'
-        )
-        if result.returncode != 0:
-            print(f"Mini-games seeding warning: {result.stderr}")
-        
-        # 3. Seed exclusive ebooks
-        print("Seeding exclusive ebooks...")
-        result = subprocess.run(
-            [sys.executable, '/app/backend/seed_exclusive_ebooks.py'],
-            capture_output=True,
-            text=True,
-            cwd='/app/backend'
-        )
-        if result.returncode != 0:
-            print(f"Exclusive ebooks seeding warning: {result.stderr}")
-        
-        # Get updated counts
-        results["ebooks"]["after"] = await db.ebooks.count_documents({})
-        results["minigames"]["after"] = await db.minigames.count_documents({})
-        results["exclusive_ebooks"]["after"] = await db.exclusive_ebooks.count_documents({})
-        
-        client.close()
+        # ketiga koleksi diisi ulang paralel, in-process (services/seeding.py)
+        seeded = await seed_catalog(db, replace=True)
+        results = {}
+        for name, r in seeded.items():
+            if r["status"] == "error":
+                print(f"{name} seeding warning: {r['error']}")
+            results[name] = {
+                "before": r.get("deleted", 0),
+                "after": await db[name].count_documents({}),
+            }
+        catalog_cache.invalidate()
         
         return {
             "success": True,
@@ -517,7 +486,7 @@ async def seed_production_database():
 async def get_database_status(secret: str = None):
     """
     Check the current status of all collections in the database
-    If secret=updateminigames2024, will update mini-games thumbnails
+    If secret=ADMIN_SECRET, will update mini-games thumbnails
     """
     try:
         mongo_url = os.environ.get('MONGO_URL')
@@ -527,7 +496,8 @@ async def get_database_status(secret: str = None):
         db = client[db_name]
         
         # Secret update feature
-        if secret == "updateminigames2024":
+        is_admin = _admin_secret_ok(secret)
+        if is_admin:
             await db.minigames.update_one(
                 {"id": 1},
                 {"$set": {
@@ -557,8 +527,9 @@ async def get_database_status(secret: str = None):
             "raw_ebook": None
         }
         
-        if secret == "updateminigames2024":
+        if is_admin:
             status["update_performed"] = "Mini-games thumbnails updated!"
+            catalog_cache.invalidate()
         
         # Count documents in each collection
         status["collections"]["ebooks"] = await db.ebooks.count_documents({})
@@ -600,3 +571,202 @@ async def get_database_status(secret: str = None):
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Status check failed: {str(e)}")
+
+
+@router.post("/admin/reconcile-payments")
+async def reconcile_payments(secret: Optional[str] = None, limit: int = 500):
+    """
+    Check pending orders against Midtrans and apply missed status changes
+    (same job as the background reconciler, on demand)
+    """
+    from server import db
+    from services.midtrans_service import midtrans_service
+    from services.reconciliation import reconcile_pending_orders
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    try:
+        stats = await reconcile_pending_orders(db, midtrans_service, limit=limit)
+        return {"success": True, "results": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reconciliation failed: {str(e)}")
+
+
+@router.post("/admin/expire-pending-orders")
+async def expire_pending_orders(secret: Optional[str] = None, older_than_hours: Optional[float] = None):
+    """
+    Mark pending orders older than `older_than_hours` as expired
+    (same job as the background sweeper, on demand)
+    """
+    from server import db
+    from services.order_expiry import PENDING_ORDER_TTL_HOURS, expire_stale_orders
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    if older_than_hours is not None and older_than_hours <= 0:
+        raise HTTPException(status_code=400, detail="older_than_hours must be positive")
+    try:
+        stats = await expire_stale_orders(
+            db, older_than_hours=older_than_hours if older_than_hours is not None else PENDING_ORDER_TTL_HOURS
+        )
+        return {"success": True, "results": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Pending order sweep failed: {str(e)}")
+
+
+@router.post("/admin/resend-order-emails")
+async def resend_order_emails(
+    job_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    secret: Optional[str] = None,
+    dry_run: bool = False,
+    restart: bool = False,
+):
+    """
+    Resend the "order paid" email for every SUCCESS order created in [since, until)
+    Runs in the background and checkpoints per batch; calling again with the
+    same job_id resumes an interrupted job. Poll progress with GET.
+    """
+    from server import db
+    from routes.email_service import smtp_transport
+    from services.bulk_resend import resend_requires_smtp, start_resend_job
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    # job yang dilanjutkan memakai dryRun dari checkpoint-nya
+    if not smtp_transport.configured and await resend_requires_smtp(db, job_id, dry_run=dry_run, restart=restart):
+        raise HTTPException(status_code=400, detail="SMTP is not configured")
+    started = start_resend_job(db, job_id, since=since, until=until, dry_run=dry_run, restart=restart)
+    if not started:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is already running")
+    return {"success": True, "jobId": job_id, "status": "started"}
+
+
+@router.get("/admin/resend-order-emails/{job_id}")
+async def get_resend_job(job_id: str, secret: Optional[str] = None):
+    from server import db
+    from services.bulk_resend import get_checkpoint, is_running
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    checkpoint = await get_checkpoint(db, job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    checkpoint["lastId"] = str(checkpoint["lastId"]) if checkpoint.get("lastId") is not None else None
+    checkpoint["running"] = is_running(job_id)
+    return checkpoint
+
+
+@router.get("/admin/orders/{order_id}/payments")
+async def get_order_payments(order_id: str, secret: Optional[str] = None, limit: int = 100):
+    """Payment event history for one order (from the `payments` collection)"""
+    from server import db
+    from services.payment_events import payment_events
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    events = await payment_events.history(db, order_id, limit=min(max(limit, 1), 500))
+    return {"orderId": order_id, "payments": events}
+
+
+@router.get("/admin/indexes")
+async def get_index_report(secret: Optional[str] = None):
+    """
+    Compare declared indexes (services/indexes.py) with what exists:
+    missing, undeclared, and unused ($indexStats ops == 0 since mongod start)
+    """
+    from server import db
+    from services import indexes
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    try:
+        report = await indexes.index_report(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Index report failed: {str(e)}")
+    return {"success": True, "lastBootstrap": indexes.last_result, "collections": report}
+
+
+@router.post("/admin/indexes")
+async def ensure_indexes_now(secret: Optional[str] = None):
+    """Create any missing declared index now (same as the startup bootstrap)"""
+    from server import db
+    from services import indexes
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    results = await indexes.ensure_indexes(db)
+    indexes.last_result = results
+    return {"success": True, "results": results}
+
+
+@router.post("/admin/orders/{order_id}/game-access")
+async def issue_game_access(order_id: str, secret: Optional[str] = None, ttl_hours: Optional[float] = None):
+    """
+    Issue a signed game access link for the minigames in a paid order
+    ttl_hours defaults to (and may not exceed) GAME_ACCESS_TTL_HOURS
+    """
+    from server import db
+    from services.game_access import (
+        GAME_ACCESS_TTL_HOURS, GameAccessNotConfigured, game_access_link, game_access_tokens,
+    )
+
+    _require_admin_secret(secret)
+    if ttl_hours is not None and not 0 < ttl_hours <= GAME_ACCESS_TTL_HOURS:
+        raise HTTPException(status_code=400, detail=f"ttl_hours must be in (0, {GAME_ACCESS_TTL_HOURS:g}]")
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    order = await db.orders.find_one({"orderId": order_id}, {"_id": 0, "paymentStatus": 1, "items": 1})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.get("paymentStatus") != "SUCCESS":
+        raise HTTPException(status_code=400, detail="Order is not paid")
+    game_ids = sorted({
+        it.get("ebookId") for it in order.get("items", [])
+        if it.get("productType") == "minigame" and it.get("ebookId")
+    })
+    if not game_ids:
+        raise HTTPException(status_code=400, detail="Order has no minigames")
+
+    try:
+        token, claims = game_access_tokens.issue(
+            game_ids, order_id, ttl_seconds=ttl_hours * 3600 if ttl_hours else None
+        )
+    except GameAccessNotConfigured:
+        raise HTTPException(status_code=503, detail="Game access is not configured")
+    return {
+        "success": True,
+        "token": token,
+        "link": game_access_link(token),
+        "gameIds": game_ids,
+        "expiresAt": claims.expires_at_datetime.isoformat() + "Z",
+    }
+
+
+@router.post("/admin/game-access/revoke")
+async def revoke_game_access(secret: Optional[str] = None, token: Optional[str] = None,
+                             order_id: Optional[str] = None):
+    """Revoke one game access token, or every token issued for an order"""
+    from server import db
+    from services.game_access import GameAccessNotConfigured, InvalidGameToken, game_access_tokens
+
+    _require_admin_secret(secret)
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    if not token and not order_id:
+        raise HTTPException(status_code=400, detail="token or order_id required")
+    try:
+        revoked = await game_access_tokens.revoke(db, token=token, order_id=order_id)
+    except InvalidGameToken as e:
+        raise HTTPException(status_code=400, detail=f"Invalid token: {e}")
+    except GameAccessNotConfigured:
+        raise HTTPException(status_code=503, detail="Game access is not configured")
+    return {"success": True, "revoked": revoked}
@@ -1,57 +1,100 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Header
+from fastapi.responses import Response
 from typing import Optional, List
 from models import Ebook
+from services.catalog_cache import catalog_cache, render_json
+from services.http_cache import etag_matches
+from services.pagination import DEFAULT_PAGE_SIZE, InvalidCursor, decode_cursor, MAX_PAGE_SIZE
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ebooks", tags=["ebooks"])
 
+CATALOG_CACHE_CONTROL = os.environ.get("CATALOG_CACHE_CONTROL", "public, max-age=60")
+
+
+def _catalog_response(body: bytes, if_none_match: Optional[str]) -> Response:
+    """Kirim bytes yang sudah dirender, atau 304 bila ETag klien masih cocok."""
+    headers = {"ETag": catalog_cache.etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if etag_matches(if_none_match, catalog_cache.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.get("", response_model=List[Ebook])
 async def get_ebooks(
     ageGroup: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
-    productType: Optional[str] = Query("ebook")
+    productType: Optional[str] = Query("ebook"),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Get all products with optional filters
     Support for ebook, minigame, and ebook_exclusive types
+    Served from the in-process catalog cache (services/catalog_cache.py)
+    as pre-rendered JSON with an ETag; If-None-Match -> 304
     """
     from server import db
     
     try:
-        # Build query
-        query = {}
-        
-        # Filter by age group and category (but not productType initially)
-        if ageGroup and ageGroup != "all":
-            query["ageGroup"] = ageGroup
-        if category and category != "all":
-            query["category"] = category
-        
-        # Fetch from appropriate collection based on productType
-        if productType == "minigame":
-            products = await db.minigames.find(query).to_list(100)
-        elif productType == "ebook_exclusive":
-            products = await db.exclusive_ebooks.find(query).to_list(100)
-        else:
-            # Default to ebooks collection - filter for non-bonus items in Python
-            all_ebooks = await db.ebooks.find(query).to_list(100)
-            # Filter out bonus items
-            products = [e for e in all_ebooks if not e.get('isBonus', False)]
-        
-        # Convert MongoDB _id to string and remove it
-        for product in products:
-            product.pop('_id', None)
-        
-        return products
+        await catalog_cache.ensure_loaded(db)
+        body = catalog_cache.render_products(productType, ageGroup, category)
+        return _catalog_response(body, if_none_match)
     
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch products")
 
 
+@router.get("/page")
+async def get_ebooks_page(
+    ageGroup: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    productType: Optional[str] = Query("ebook"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="nextCursor dari halaman sebelumnya"),
+    fields: Optional[str] = Query(None, description="Comma-separated, mis. id,title,price"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Paginated product listing (keyset on id)
+    Returns {"items": [...], "nextCursor": str | null}; pass nextCursor back
+    as `cursor` to get the next page. `fields` limits the returned keys.
+    """
+    from server import db
+
+    try:
+        after = decode_cursor(cursor)
+        if after is not None and not isinstance(after, int):
+            raise InvalidCursor("cursor id must be an integer")
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    field_list = None
+    if fields:
+        field_list = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in field_list if f not in Ebook.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        if "id" not in field_list:
+            field_list.insert(0, "id")
+
+    try:
+        await catalog_cache.ensure_loaded(db)
+        items, next_cursor = catalog_cache.page_products(
+            productType, ageGroup, category,
+            limit=limit, after=after, fields=field_list,
+        )
+        body = render_json({"items": items, "nextCursor": next_cursor})
+        return _catalog_response(body, if_none_match)
+
+    except Exception as e:
+        logger.error(f"Error fetching product page: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch products")
+
+
 @router.get("/debug/raw")
 async def get_raw_ebook():
     """
@@ -77,20 +120,20 @@ async def get_raw_ebook():
 
 
 @router.get("/{ebook_id}", response_model=Ebook)
-async def get_ebook(ebook_id: int):
+async def get_ebook(ebook_id: int, if_none_match: Optional[str] = Header(None)):
     """
     Get single ebook by ID
     """
     from server import db
     
     try:
-        ebook = await db.ebooks.find_one({"id": ebook_id})
+        await catalog_cache.ensure_loaded(db)
+        body = catalog_cache.render_product("ebook", ebook_id)
         
-        if not ebook:
+        if body is None:
             raise HTTPException(status_code=404, detail="Ebook not found")
         
-        ebook.pop('_id', None)
-        return ebook
+        return _catalog_response(body, if_none_match)
     
     except HTTPException:
         raise
@@ -1,44 +1,34 @@
 # routes/email_service.py
-import os, smtplib, ssl, asyncio
+import os
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import List, Dict
 
+from services.email_templates import render_order_paid_html
+from services.mail_transport import AsyncSMTPTransport
+
 SMTP_HOST = os.getenv("SMTP_HOST")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 MAIL_FROM = os.getenv("MAIL_FROM", SMTP_USER or "no-reply@example.com")
 
+smtp_transport = AsyncSMTPTransport(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, start_tls=True)
+
 def _render_html(order: dict, products: List[dict]) -> str:
-    lines = []
-    lines.append(f"<p>Terima kasih! Order <b>#{order.get('orderId')}</b> telah <b>berhasil dibayar</b>.</p>")
-    if products:
-        lines.append("<ul>")
-        for p in products:
-            title = p.get("title") or "Produk"
-            ptype = p.get("product_type") or "ebook"
-            file_url = p.get("file_url")
-            external_url = p.get("external_url")
-            # Tampilkan tautan yang relevan
-            if ptype in ("ebook", "ebook_exclusive") and file_url:
-                lines.append(f'<li>{title} — <a href="{file_url}" target="_blank" rel="noopener">Download</a></li>')
-            elif ptype == "minigame" and external_url:
-                lines.append(f'<li>{title} — <a href="{external_url}" target="_blank" rel="noopener">Mainkan</a></li>')
-            else:
-                lines.append(f"<li>{title}</li>")
-        lines.append("</ul>")
-    lines.append("<p>Jika tautan tidak berfungsi, balas email ini ya.</p>")
-    return "\n".join(lines)
+    # judul produk di-escape; baris produk di-cache (lihat services/email_templates.py)
+    return render_order_paid_html(order, products)
 
 async def send_order_email(to_email: str, order: dict, products: List[dict]) -> None:
     """
-    Kirim email sederhana via SMTP (TLS). ENV wajib:
+    Kirim email sederhana via SMTP (STARTTLS, async + pooled). ENV wajib:
     SMTP_HOST, SMTP_PORT(=587), SMTP_USER, SMTP_PASS, MAIL_FROM
     """
-    if not to_email or not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
-        # Jangan gagalkan webhook kalau SMTP belum dikonfigurasi.
-        return
+    # dipanggil dari worker outbox / bulk resend (bukan webhook): gagal keras agar
+    # job tetap di antrian, jangan tercatat terkirim
+    smtp_transport.require_configured()
+    if not to_email:
+        raise ValueError(f"order {order.get('orderId')} has no customerEmail")
 
     msg = MIMEMultipart("alternative")
     msg["Subject"] = f"EbookAnak — Order #{order.get('orderId')} Paid"
@@ -48,13 +38,4 @@ async def send_order_email(to_email: str, order: dict, products: List[dict]) ->
     html = _render_html(order, products)
     msg.attach(MIMEText(html, "html"))
 
-    context = ssl.create_default_context()
-
-    def _send():
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls(context=context)
-            server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(MAIL_FROM, [to_email], msg.as_string())
-
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _send)
+    await smtp_transport.send_message(msg, recipients=[to_email])
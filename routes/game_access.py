@@ -0,0 +1,71 @@
+# routes/game_access.py
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+import logging
+
+from services.access_counter import access_counter
+from services.catalog_cache import catalog_cache
+from services.game_access import (
+    GameAccessNotConfigured, InvalidGameToken, RevokedGameToken, game_access_tokens,
+)
+from services.product_join import fetch_products_by_type
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _game_payload(doc: dict) -> dict:
+    return {
+        "id": doc.get("id"),
+        "title": doc.get("title"),
+        "thumbnailUrl": doc.get("thumbnailUrl"),
+        "icon": doc.get("icon"),
+        "gameUrl": doc.get("gameUrl") or doc.get("external_url"),
+    }
+
+
+async def _load_games(db, game_ids):
+    """Dari catalog cache; fallback satu query $in bila cache gagal dimuat."""
+    try:
+        await catalog_cache.ensure_loaded(db)
+        docs = [catalog_cache.get_document("minigame", gid) for gid in game_ids]
+    except Exception as e:
+        logger.warning(f"Catalog cache unavailable for game access: {e}")
+        by_id = (await fetch_products_by_type(db, {"minigame": game_ids})).get("minigame", {})
+        docs = [by_id.get(gid) for gid in game_ids]
+    return [_game_payload(d) for d in docs if d]
+
+
+@router.get("/games/access")
+async def get_game_access(
+    token: str = Query(..., description="Signed token from /games/play?token=..."),
+    gameId: Optional[int] = None,
+):
+    """
+    Verify a game access token and return the games it unlocks
+    Signature/expiry check is CPU-only; Mongo is consulted (and cached) only
+    for revocation. With `gameId`, returns just that game or 403.
+    """
+    from server import db
+
+    try:
+        claims = await game_access_tokens.check(db, token)
+    except RevokedGameToken:
+        raise HTTPException(status_code=403, detail="Access has been revoked")
+    except InvalidGameToken as e:
+        raise HTTPException(status_code=401, detail=f"Invalid game access token: {e}")
+    except GameAccessNotConfigured:
+        raise HTTPException(status_code=503, detail="Game access is not configured")
+
+    if gameId is not None and not claims.allows(gameId):
+        raise HTTPException(status_code=403, detail="Game not included in this access token")
+
+    # accessCount di-flush berkala (write-behind), bukan $inc per request
+    access_counter.record(claims)
+
+    game_ids = [gameId] if gameId is not None else list(claims.game_ids)
+    return {
+        "orderId": claims.order_id,
+        "expiresAt": claims.expires_at_datetime.isoformat() + "Z",
+        "games": await _load_games(db, game_ids) if db is not None else [],
+    }
@@ -1,11 +1,24 @@
 # routes/orders.py
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from models import OrderCreate, PaymentVerification, PaymentStatus
-from services.midtrans_service import MidtransService
+from services.midtrans_service import PENDING_STATUSES, midtrans_service
+from services.order_events import (
+    ORDER_EVENTS_HEARTBEAT_SECONDS,
+    ORDER_EVENTS_MAX_SECONDS,
+    ORDER_EVENTS_POLL_SECONDS,
+    ORDER_STATUS_FIELDS,
+    order_events,
+    order_status_event,
+)
+from services.order_status_cache import order_status_cache
+from services.product_join import fetch_products_by_type
 from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
 from typing import List, Dict, Any
+import asyncio
+import json
 import uuid
 import os
 import logging
@@ -19,59 +32,10 @@ load_dotenv(ROOT_DIR / '.env')
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/orders", tags=["orders"])
-midtrans_service = MidtransService()
 
 # ---------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------
-async def _attach_products_for_order(db, order: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Tambahkan field 'products' ke order untuk kebutuhan email & Game Access.
-    Sumber data: ebooks, minigames, exclusive_ebooks.
-    Field diseragamkan:
-      - product_type: 'ebook' | 'minigame' | 'ebook_exclusive'
-      - file_url: file_url | driveDownloadLink
-      - external_url: external_url | gameUrl
-    """
-    products: List[Dict[str, Any]] = []
-
-    for it in order.get("items", []):
-        ebook_id = (it or {}).get("ebookId")
-        ptype = (it or {}).get("productType") or "ebook"
-        if not ebook_id:
-            continue
-
-        doc = None
-        # cari sesuai type dulu
-        if ptype == "minigame":
-            doc = await db.minigames.find_one({"id": ebook_id})
-        elif ptype == "ebook_exclusive":
-            doc = await db.exclusive_ebooks.find_one({"id": ebook_id})
-        else:
-            doc = await db.ebooks.find_one({"id": ebook_id})
-
-        # fallback jika type tidak konsisten
-        if not doc:
-            doc = await db.ebooks.find_one({"id": ebook_id}) \
-               or await db.minigames.find_one({"id": ebook_id}) \
-               or await db.exclusive_ebooks.find_one({"id": ebook_id})
-
-        if not doc:
-            continue
-
-        products.append({
-            "id": doc.get("id"),
-            "title": doc.get("title"),
-            "product_type": ptype if ptype in ("ebook", "minigame", "ebook_exclusive")
-                                 else ("minigame" if doc.get("external_url") or doc.get("gameUrl") else "ebook"),
-            "file_url": doc.get("file_url") or doc.get("driveDownloadLink"),
-            "external_url": doc.get("external_url") or doc.get("gameUrl"),
-        })
-
-    order["products"] = products
-    return order
-
-
 def _serialize_order(o: Dict[str, Any]) -> Dict[str, Any]:
     """Hapus _id dan serialize datetime → ISO agar aman dikirim ke client."""
     out = dict(o)
@@ -125,19 +89,19 @@ async def create_order(order_data: OrderCreate):
     from server import db
 
     try:
-        # Ambil detail produk dari koleksi masing-masing
+        # Ambil detail produk: satu query $in per koleksi, dijalankan paralel
+        ids_by_type: Dict[str, List[int]] = {}
+        for item in order_data.items:
+            product_type = item.productType.value if hasattr(item.productType, 'value') else item.productType
+            ids_by_type.setdefault(product_type, []).append(item.productId)
+
+        products_by_type = await fetch_products_by_type(db, ids_by_type)
+
         order_items: List[Dict[str, Any]] = []
 
         for item in order_data.items:
             product_type = item.productType.value if hasattr(item.productType, 'value') else item.productType
-            product = None
-
-            if product_type == 'minigame':
-                product = await db.minigames.find_one({"id": item.productId})
-            elif product_type == 'ebook_exclusive':
-                product = await db.exclusive_ebooks.find_one({"id": item.productId})
-            else:
-                product = await db.ebooks.find_one({"id": item.productId})
+            product = products_by_type.get(product_type, {}).get(item.productId)
 
             if not product:
                 raise HTTPException(
@@ -162,9 +126,141 @@ async def create_order(order_data: OrderCreate):
         order_id = f"ORDER-{uuid.uuid4().hex[:10].upper()}"
 
         # Buat transaksi Midtrans
-        midtrans_result = midtrans_service.create_transaction(
+        midtrans_result = await midtrans_service.create_transaction(
             order_id=order_id,
             customer_name=order_data.customerName,
             customer_email=order_data.customerEmail,
             items=order_items,
-            to
+            total=pricing["total"],
+            discount=pricing["discount"],
+            customer_phone=order_data.customerPhone or "",
+        )
+
+        if not midtrans_result.get("success"):
+            raise HTTPException(
+                status_code=502,
+                detail=f"Payment gateway error: {midtrans_result.get('error')}"
+            )
+
+        now = datetime.utcnow()
+        await db.orders.insert_one({
+            "orderId": order_id,
+            "customerEmail": order_data.customerEmail,
+            "customerName": order_data.customerName,
+            "customerPhone": order_data.customerPhone or "",
+            "items": order_items,
+            **pricing,
+            "paymentStatus": PaymentStatus.PENDING.value,
+            "midtransOrderId": order_id,
+            "snapToken": midtrans_result["token"],
+            "createdAt": now,
+            "updatedAt": now,
+            "paidAt": None,
+        })
+
+        return {
+            "orderId": order_id,
+            "snapToken": midtrans_result["token"],
+            "total": pricing["total"],
+            "redirectUrl": midtrans_result["redirect_url"],
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating order: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to create order")
+
+# ---------------------------------------------------------------------
+# GET /orders/{order_id}/status
+# ---------------------------------------------------------------------
+@router.get("/{order_id}/status")
+async def get_order_status(order_id: str):
+    """
+    Status pembayaran order untuk polling checkout: hanya paymentStatus,
+    paidAt dan total, dari cache TTL pendek (services/order_status_cache.py).
+    """
+    from server import db
+
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+    status = await order_status_cache.get(db, order_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return status
+
+# ---------------------------------------------------------------------
+# GET /orders/{order_id}/events (Server-Sent Events)
+# ---------------------------------------------------------------------
+_ORDER_EVENT_PROJECTION = {"_id": 0, **{k: 1 for k in ORDER_STATUS_FIELDS}}
+
+
+def _sse_event(event: Dict[str, Any], name: str = "status") -> str:
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _order_event_stream(db, order_id: str, queue: asyncio.Queue, current: Dict[str, Any]):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + ORDER_EVENTS_MAX_SECONDS
+    last_status = current["paymentStatus"]
+    try:
+        # retry: jeda reconnect EventSource bila stream ditutup server (umur maksimum)
+        yield "retry: 3000\n" + _sse_event(current)
+        while last_status in PENDING_STATUSES and loop.time() < deadline:
+            polling = not order_events.watching
+            event = None
+            try:
+                async with asyncio.timeout(ORDER_EVENTS_POLL_SECONDS if polling else ORDER_EVENTS_HEARTBEAT_SECONDS):
+                    event = await queue.get()
+            except TimeoutError:
+                if polling:
+                    # tanpa change stream: update dari worker lain hanya terlihat lewat Mongo
+                    doc = await db.orders.find_one({"orderId": order_id}, _ORDER_EVENT_PROJECTION)
+                    event = order_status_event(doc) if doc else None
+            if event is None or event["paymentStatus"] == last_status:
+                yield ": ping\n\n"
+                continue
+            last_status = event["paymentStatus"]
+            yield _sse_event(event)
+        if last_status not in PENDING_STATUSES:
+            # status final: client memanggil EventSource.close(), tidak reconnect
+            yield _sse_event({"orderId": order_id, "paymentStatus": last_status}, "done")
+    finally:
+        order_events.unsubscribe(order_id, queue)
+
+
+@router.get("/{order_id}/events")
+async def order_events_stream(order_id: str):
+    """
+    Stream perubahan paymentStatus order (SSE) untuk halaman checkout.
+    Event pertama (`status`) = status saat ini. Begitu order tidak lagi pending,
+    server mengirim event `status` lalu `done` dan menutup stream; client harus
+    memanggil EventSource.close() saat menerima `done`. Setelah
+    ORDER_EVENTS_MAX_SECONDS stream ditutup tanpa `done` dan EventSource
+    reconnect sendiri. Order yang sudah tidak pending saat connect dijawab 204
+    (EventSource berhenti reconnect); statusnya lewat GET /orders/{order_id}/status.
+    """
+    from server import db
+
+    if db is None:
+        raise HTTPException(status_code=500, detail="db not initialized")
+
+    # subscribe dulu agar perubahan di antara find_one dan stream tidak hilang
+    queue = order_events.subscribe(order_id)
+    try:
+        doc = await db.orders.find_one({"orderId": order_id}, _ORDER_EVENT_PROJECTION)
+    except Exception:
+        order_events.unsubscribe(order_id, queue)
+        raise
+    if not doc:
+        order_events.unsubscribe(order_id, queue)
+        raise HTTPException(status_code=404, detail="Order not found")
+    if doc.get("paymentStatus") not in PENDING_STATUSES:
+        order_events.unsubscribe(order_id, queue)
+        return Response(status_code=204)
+
+    return StreamingResponse(
+        _order_event_stream(db, order_id, queue, order_status_event(doc)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,45 +1,353 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import Response, StreamingResponse
+from cachetools import LRUCache, TTLCache
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from services.http_cache import etag_matches, content_etag
+from services.image_renditions import (
+    negotiate_format, rendition_key, rendition_store, snap_quality, snap_width,
+)
+from PIL import UnidentifiedImageError
+import asyncio
 import httpx
 import logging
+import os
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.get("/proxy/image")
-async def proxy_image(url: str):
+# Validate URL is from trusted image CDN
+ALLOWED_DOMAINS = (
+    "https://i.ibb.co/",
+    "https://res.cloudinary.com/",
+)
+
+# Cache memori (LRU dibatasi total byte) + batas per gambar agar satu file besar
+# tidak mengusir seluruh isi cache
+PROXY_CACHE_MAX_BYTES = int(os.environ.get("PROXY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PROXY_CACHE_MAX_ITEM_BYTES = int(os.environ.get("PROXY_CACHE_MAX_ITEM_BYTES", str(2 * 1024 * 1024)))
+PROXY_TIMEOUT = float(os.environ.get("PROXY_TIMEOUT", "10"))
+PROXY_MAX_CONNECTIONS = int(os.environ.get("PROXY_MAX_CONNECTIONS", "50"))
+PROXY_SOURCE_ETAG_TTL = float(os.environ.get("PROXY_SOURCE_ETAG_TTL", "3600"))
+# chunk maksimum yang boleh antre per pembaca setelah body melewati batas cache
+PROXY_STREAM_WINDOW_CHUNKS = int(os.environ.get("PROXY_STREAM_WINDOW_CHUNKS", "16"))
+
+CACHE_HEADERS = {
+    "Cache-Control": "public, max-age=31536000",
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+@dataclass
+class CachedImage:
+    content: bytes
+    content_type: str
+    etag: str
+
+
+_cache: LRUCache = LRUCache(maxsize=PROXY_CACHE_MAX_BYTES, getsizeof=lambda item: len(item.content) or 1)
+# url -> ETag sumber terakhir (untuk kunci rendisi sumber yang tidak masuk _cache)
+_source_etags: TTLCache = TTLCache(maxsize=10000, ttl=PROXY_SOURCE_ETAG_TTL)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Satu client pooled (keep-alive) untuk semua request proxy."""
+    global _client
+    if _client is None or _client.is_closed:
+        # redirect TIDAK diikuti: target redirect bisa di luar ALLOWED_DOMAINS (SSRF);
+        # 3xx diperlakukan sebagai gambar tidak ditemukan
+        _client = httpx.AsyncClient(
+            timeout=PROXY_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=PROXY_MAX_CONNECTIONS,
+                max_keepalive_connections=PROXY_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+@router.on_event("shutdown")
+async def _close_proxy_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _upstream_ok(status_code: Optional[int]) -> bool:
+    return status_code is not None and 200 <= status_code < 300
+
+
+def _cached_response(item: CachedImage, if_none_match: Optional[str]) -> Response:
+    headers = {**CACHE_HEADERS, "ETag": item.etag}
+    if etag_matches(if_none_match, item.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=item.content, media_type=item.content_type, headers=headers)
+
+
+class InflightFetch:
     """
-    Proxy images from external sources to bypass CORS/CSP issues
+    Satu download upstream yang dibagi (single-flight) oleh semua request yang
+    meminta URL yang sama selama download berjalan. Download berjalan sebagai
+    task tersendiri (tidak ikut batal bila satu klien putus).
+
+    Chunk hanya disimpan selama total ukuran masih muat di cache
+    (PROXY_CACHE_MAX_ITEM_BYTES); peminta yang bergabung belakangan memutar
+    ulang chunk itu lalu menerima sisanya lewat queue masing-masing. Begitu
+    melewati batas, buffer dibuang dan download dilepas dari _inflight
+    (request baru memulai download sendiri); sisa body hanya diteruskan ke
+    pembaca yang sudah ada, dengan kecepatan pembaca paling lambat.
     """
-    try:
-        # Validate URL is from trusted image CDN
-        allowed_domains = [
-            "https://i.ibb.co/",
-            "https://res.cloudinary.com/"
-        ]
-        
-        if not any(url.startswith(domain) for domain in allowed_domains):
-            raise HTTPException(status_code=400, detail="Invalid image URL - must be from trusted CDN")
-        
-        # Fetch image from CDN
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            
-            # Return image with proper content type
-            content_type = response.headers.get("content-type", "image/png")
-            return Response(
-                content=response.content,
-                media_type=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=31536000",
-                    "Access-Control-Allow-Origin": "*"
-                }
-            )
-    
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Failed to fetch image {url}: {e}")
+
+    def __init__(self, url: str, request_headers: Optional[Dict[str, str]] = None):
+        self.url = url
+        self.request_headers = request_headers or {}
+        self.status_code: Optional[int] = None
+        self.content_type = "image/png"
+        self.headers: Dict[str, str] = {}
+        self.etag: Optional[str] = None
+        self.chunks: List[bytes] = []
+        self.buffering = True  # False setelah body melewati PROXY_CACHE_MAX_ITEM_BYTES
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.ready = asyncio.Event()  # status & header upstream sudah diketahui
+        self._readers: Set[asyncio.Queue] = set()
+        self._drained = asyncio.Event()  # pembaca mengambil chunk / berhenti membaca
+        self.task: Optional[asyncio.Task] = None
+
+    def _unshare(self) -> None:
+        if _inflight.get(self.url) is self:
+            del _inflight[self.url]
+
+    async def _wait_for_readers(self) -> None:
+        while any(queue.qsize() >= PROXY_STREAM_WINDOW_CHUNKS for queue in self._readers):
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def run(self) -> None:
+        upstream = None
+        try:
+            client = _get_client()
+            request = client.build_request("GET", self.url, headers=self.request_headers)
+            upstream = await client.send(request, stream=True)
+            self.status_code = upstream.status_code
+            if _upstream_ok(upstream.status_code) or upstream.status_code == 304:
+                self.content_type = upstream.headers.get("content-type", "image/png")
+                upstream_etag = upstream.headers.get("etag")
+                # ETag weak dari CDN tidak dipakai sebagai kunci cache kita
+                self.etag = upstream_etag if upstream_etag and not upstream_etag.startswith("W/") else None
+                if upstream_etag:
+                    self.headers["ETag"] = upstream_etag
+                if upstream.headers.get("last-modified"):
+                    self.headers["Last-Modified"] = upstream.headers["last-modified"]
+                if upstream.headers.get("content-length") and not upstream.headers.get("content-encoding"):
+                    self.headers["Content-Length"] = upstream.headers["content-length"]
+            self.ready.set()
+
+            if not _upstream_ok(upstream.status_code):
+                return
+
+            size = 0
+            async for chunk in upstream.aiter_bytes():
+                size += len(chunk)
+                if self.buffering and size > PROXY_CACHE_MAX_ITEM_BYTES:
+                    self.buffering = False
+                    self.chunks = []
+                    self._unshare()
+                if self.buffering:
+                    self.chunks.append(chunk)
+                else:
+                    if not self._readers:
+                        return  # tidak ada yang menunggu dan terlalu besar untuk cache
+                    await self._wait_for_readers()
+                for queue in self._readers:
+                    queue.put_nowait(chunk)
+
+            if self.buffering:
+                content = b"".join(self.chunks)
+                _cache[self.url] = CachedImage(
+                    content=content,
+                    content_type=self.content_type,
+                    etag=self.etag or content_etag(content),
+                )
+        except Exception as e:
+            logger.error(f"Error fetching image {self.url}: {e}")
+            self.error = e
+        finally:
+            self.done = True
+            self.ready.set()
+            self._unshare()
+            for queue in self._readers:
+                queue.put_nowait(None)
+            if upstream is not None:
+                await upstream.aclose()
+
+    async def iter_chunks(self):
+        if not self.buffering:
+            # awal body sudah dibuang: ambil ulang sendiri
+            async for chunk in _start_fetch(self.url).iter_chunks():
+                yield chunk
+            return
+        replay, done = list(self.chunks), self.done
+        queue: asyncio.Queue = asyncio.Queue()
+        self._readers.add(queue)
+        try:
+            for chunk in replay:
+                yield chunk
+            while not done:
+                chunk = await queue.get()
+                self._drained.set()
+                if chunk is None:
+                    break
+                yield chunk
+            if self.error is not None:
+                raise self.error
+        finally:
+            self._readers.discard(queue)
+            self._drained.set()
+
+    async def content(self) -> bytes:
+        """Tunggu download selesai dan kembalikan seluruh body."""
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+
+_inflight: Dict[str, InflightFetch] = {}
+
+
+def _start_fetch(url: str, request_headers: Optional[Dict[str, str]] = None) -> InflightFetch:
+    fetch = InflightFetch(url, request_headers)
+    fetch.task = asyncio.create_task(fetch.run())
+    return fetch
+
+
+def _get_inflight(url: str) -> InflightFetch:
+    fetch = _inflight.get(url)
+    if fetch is None:
+        fetch = _inflight[url] = _start_fetch(url)
+    return fetch
+
+
+async def _original_image(url: str) -> Tuple[bytes, str]:
+    """Body gambar sumber + ETag-nya (ETag strong CDN, atau hash isi)."""
+    cached = _cache.get(url)
+    if cached is not None:
+        return cached.content, cached.etag
+    fetch = _get_inflight(url)
+    await fetch.ready.wait()
+    if fetch.status_code is not None and not _upstream_ok(fetch.status_code):
+        logger.error(f"Failed to fetch image {url}: HTTP {fetch.status_code}")
         raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        content = await fetch.content()
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load image")
+    etag = fetch.etag or content_etag(content)
+    _source_etags[url] = etag
+    return content, etag
+
+
+async def _rendition_response(
+    url: str,
+    w: Optional[int],
+    q: Optional[int],
+    accept: Optional[str],
+    if_none_match: Optional[str],
+) -> Response:
+    width, quality, fmt = snap_width(w), snap_quality(q), negotiate_format(accept)
+
+    # Kunci rendisi ikut ETag sumber: gambar di CDN berubah -> rendisi & ETag baru.
+    # Sumber besar (tidak masuk _cache) diingat ETag-nya selama PROXY_SOURCE_ETAG_TTL
+    # agar hit rendisi tidak perlu mengunduh ulang sumbernya.
+    data: Optional[bytes] = None
+    cached = _cache.get(url)
+    source_etag = cached.etag if cached is not None else _source_etags.get(url)
+    if source_etag is None:
+        data, source_etag = await _original_image(url)
+
+    key = rendition_key(url, source_etag, width, fmt, quality)
+    headers = {**CACHE_HEADERS, "ETag": f'"r-{key[:32]}"', "Vary": "Accept"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    found = await rendition_store.lookup(key)
+    if found is not None:
+        content, media_type = found
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    if data is None:
+        data, fresh_etag = await _original_image(url)
+        if fresh_etag != source_etag:
+            key = rendition_key(url, fresh_etag, width, fmt, quality)
+            headers["ETag"] = f'"r-{key[:32]}"'
+    try:
+        content, media_type = await rendition_store.get_or_render(key, data, width, fmt, quality)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=415, detail="Upstream file is not a supported image")
     except Exception as e:
-        logger.error(f"Error proxying image: {e}")
+        logger.error(f"Error rendering image {url}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process image")
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@router.get("/proxy/image")
+async def proxy_image(
+    url: str,
+    w: Optional[int] = Query(None, ge=1, le=4000, description="Target width (px), snapped to a standard size"),
+    q: Optional[int] = Query(None, ge=1, le=100, description="Encoder quality for JPEG/WebP/AVIF"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """
+    Proxy images from external sources to bypass CORS/CSP issues
+    Cache hits are served from memory. Misses share one upstream download
+    per URL (single-flight) that is streamed to every waiting request and
+    captured for the cache (if small enough). Conditional requests with no
+    download to join are forwarded to the CDN (304 passes through).
+    With `w` and/or `q`, returns a resized rendition in AVIF/WebP when the
+    Accept header allows it, cached on disk per (url, source ETag, width,
+    format, quality); width and quality are snapped to a few presets.
+    """
+    if not url.startswith(ALLOWED_DOMAINS):
+        raise HTTPException(status_code=400, detail="Invalid image URL - must be from trusted CDN")
+
+    if w is not None or q is not None:
+        return await _rendition_response(url, w, q, accept, if_none_match)
+
+    cached = _cache.get(url)
+    if cached is not None:
+        return _cached_response(cached, if_none_match)
+
+    fetch = _inflight.get(url)
+    if fetch is None and (if_none_match or if_modified_since):
+        # Tidak ada download yang bisa diikuti: teruskan conditional request ke CDN,
+        # kalau browser sudah punya versi ini CDN cukup balas 304 tanpa body.
+        # Download ini tidak dibagi (jawaban 304 hanya berlaku untuk klien ini).
+        upstream_headers = {}
+        if if_none_match:
+            upstream_headers["If-None-Match"] = if_none_match
+        if if_modified_since:
+            upstream_headers["If-Modified-Since"] = if_modified_since
+        fetch = _start_fetch(url, upstream_headers)
+    elif fetch is None:
+        fetch = _get_inflight(url)
+    await fetch.ready.wait()
+
+    if fetch.status_code is None:
         raise HTTPException(status_code=500, detail="Failed to load image")
+    if fetch.status_code == 304:
+        headers = dict(CACHE_HEADERS)
+        if fetch.headers.get("ETag"):
+            headers["ETag"] = fetch.headers["ETag"]
+        return Response(status_code=304, headers=headers)
+    if not _upstream_ok(fetch.status_code):
+        logger.error(f"Failed to fetch image {url}: HTTP {fetch.status_code}")
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {**CACHE_HEADERS, **fetch.headers}
+    if etag_matches(if_none_match, fetch.etag):
+        # download tetap jalan di background untuk mengisi cache
+        return Response(status_code=304, headers={**CACHE_HEADERS, "ETag": fetch.etag})
+
+    return StreamingResponse(fetch.iter_chunks(), media_type=fetch.content_type, headers=headers)
@@ -51,7 +51,7 @@ async def test_ebook_email(data: TestEbookEmail):
             })
         
         # Send test email
-        success = send_email(
+        success = await send_email(
             to_email=data.email,
             customer_name=data.customerName,
             order_id=data.orderId,
@@ -106,7 +106,7 @@ async def test_game_email(data: TestGameEmail):
             raise HTTPException(status_code=404, detail="No games found with provided IDs")
         
         # Send test email
-        success = send_game_links_email(
+        success = await send_game_links_email(
             to_email=data.email,
             customer_name=data.customerName,
             order_id=data.orderId,
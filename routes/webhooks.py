@@ -2,16 +2,24 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
 from datetime import datetime
-from typing import List, Dict
 import os, json, hashlib
 
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
 from server import db, logger         # gunakan db & logger global dari server.py
-from .email_service import send_order_email
+from services.email_outbox import email_outbox
+from services.midtrans_service import map_transaction_status, status_transition_filter
+from services.order_events import ORDER_STATUS_FIELDS, order_events
+from services.payment_events import payment_event_id, payment_events, payment_summary
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
 MIDTRANS_SERVER_KEY = os.getenv("MIDTRANS_SERVER_KEY", "")
 
+# Ledger idempotensi: satu dokumen per (order_id, transaction_status, transaction_id)
+WEBHOOK_EVENTS_COLLECTION = "webhook_events"
+
 def _midtrans_signature_valid(payload: dict) -> bool:
     """
     Midtrans: signature_key = SHA512(order_id + status_code + gross_amount + server_key)
@@ -27,59 +35,16 @@ def _midtrans_signature_valid(payload: dict) -> bool:
     calc = hashlib.sha512(raw.encode("utf-8")).hexdigest()
     return provided == calc
 
-async def _attach_products_for_order(order: dict) -> List[Dict]:
-    """
-    Join produk dari koleksi: ebooks, minigames, exclusive_ebooks.
-    Map ke kunci seragam untuk email & Game Access:
-      - product_type: 'ebook' | 'minigame' | 'ebook_exclusive'
-      - file_url: file_url | driveDownloadLink
-      - external_url: external_url | gameUrl
-    """
-    if not db or not order:
-        return []
-    out: List[Dict] = []
-    for it in order.get("items", []):
-        ebook_id = (it or {}).get("ebookId")
-        ptype = (it or {}).get("productType") or "ebook"
-        if not ebook_id:
-            continue
-
-        doc = None
-        if ptype == "minigame":
-            doc = await db.minigames.find_one({"id": ebook_id})
-        elif ptype == "ebook_exclusive":
-            doc = await db.exclusive_ebooks.find_one({"id": ebook_id})
-        else:
-            doc = await db.ebooks.find_one({"id": ebook_id})
-
-        if not doc:
-            # fallback: coba cari di koleksi lain jika type tidak konsisten
-            doc = await db.ebooks.find_one({"id": ebook_id}) \
-               or await db.minigames.find_one({"id": ebook_id}) \
-               or await db.exclusive_ebooks.find_one({"id": ebook_id})
-
-        if not doc:
-            continue
-
-        out.append({
-            "id": doc.get("id"),
-            "title": doc.get("title"),
-            "product_type": ptype if ptype in ("ebook", "minigame", "ebook_exclusive")
-                                 else ("minigame" if doc.get("external_url") or doc.get("gameUrl") else "ebook"),
-            "file_url": doc.get("file_url") or doc.get("driveDownloadLink"),
-            "external_url": doc.get("external_url") or doc.get("gameUrl"),
-        })
-    return out
-
 @router.post("/midtrans")
 async def midtrans_webhook(req: Request):
     """
     Terima notifikasi Midtrans. Saat status settlement/capture:
     - update order.paymentStatus = SUCCESS
     - set paidAt
-    - kirim email link produk
+    - antrikan email link produk (services/email_outbox.py)
+    - catat event ke koleksi `payments`
     """
-    if not db:
+    if db is None:
         raise HTTPException(status_code=500, detail="db not initialized")
 
     body = await req.body()
@@ -96,36 +61,69 @@ async def midtrans_webhook(req: Request):
     if MIDTRANS_SERVER_KEY and not _midtrans_signature_valid(payload):
         raise HTTPException(status_code=401, detail="invalid signature")
 
-    # Map status Midtrans → status aplikasi
-    new_status = "SUCCESS" if txn_status in ("settlement", "capture") else txn_status.upper()
-
-    # Update order (berdasarkan orderId)
-    await db.orders.update_one(
-        {"orderId": order_id},
-        {"$set": {
-            "paymentStatus": new_status,
-            "midtransPayload": payload,
-            "paidAt": datetime.utcnow() if new_status == "SUCCESS" else None,
-            "updatedAt": datetime.utcnow(),
-        }}
-    )
-
-    order = await db.orders.find_one({"orderId": order_id})
-    if not order:
-        return JSONResponse({"ok": True})
-
-    # Join products untuk email
-    products = await _attach_products_for_order(order)
+    # Notifikasi ganda / retry Midtrans berhenti di sini (insert ke _id = satu lookup index)
+    event_id = payment_event_id(order_id, txn_status, payload.get("transaction_id"))
+    try:
+        await db[WEBHOOK_EVENTS_COLLECTION].insert_one({
+            "_id": event_id,
+            "orderId": order_id,
+            "transactionStatus": txn_status,
+            "transactionId": payload.get("transaction_id"),
+            "receivedAt": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return JSONResponse({"ok": True, "duplicate": True})
 
-    # Kirim email hanya jika paid
-    if new_status == "SUCCESS":
+    try:
+        await _apply_notification(order_id, txn_status, payload)
+    except Exception as e:
+        # lepas ledger agar retry Midtrans diproses ulang
+        logger.error(f"midtrans webhook {event_id} failed: {e}")
         try:
-            await send_order_email(
-                to_email=order.get("customerEmail"),
-                order=order,
-                products=products
-            )
-        except Exception as e:
-            logger.error(f"send_order_email failed: {e}")
+            await db[WEBHOOK_EVENTS_COLLECTION].delete_one({"_id": event_id})
+        except Exception as cleanup_error:
+            logger.error(f"webhook ledger cleanup failed for {event_id}: {cleanup_error}")
+        raise HTTPException(status_code=500, detail="failed to process notification")
 
+    # riwayat lengkap ke `payments` (batched, lihat services/payment_events.py)
+    payment_events.record(payload, source="webhook")
     return JSONResponse({"ok": True})
+
+
+async def _apply_notification(order_id: str, txn_status: str, payload: dict) -> None:
+    # Map status Midtrans → status aplikasi
+    new_status = map_transaction_status(txn_status)
+    now = datetime.utcnow()
+
+    # Satu update bersyarat: hanya jika status memang berubah (dan tidak turun dari SUCCESS)
+    updated = await db.orders.find_one_and_update(
+        {"orderId": order_id, "paymentStatus": status_transition_filter(new_status)},
+        {
+            "$set": {
+                "paymentStatus": new_status,
+                "payment": payment_summary(payload),
+                "paidAt": now if new_status == "SUCCESS" else None,
+                "updatedAt": now,
+            },
+            # payload mentah lama dipindah ke `payments`; kecilkan dokumen order
+            "$unset": {"midtransPayload": ""},
+        },
+        projection={"_id": 0, **{k: 1 for k in ORDER_STATUS_FIELDS}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated is not None:
+        # SSE checkout di worker ini; worker lain lewat change stream
+        order_events.publish(updated)
+
+    # Email hanya jika paid; cukup diantrikan, dikirim worker outbox
+    if new_status != "SUCCESS":
+        return
+    if updated is None:
+        # Tidak ada perubahan: order tidak dikenal, atau sudah SUCCESS lebih dulu
+        # (reconciler / retry setelah enqueue gagal). Outbox idempotent per orderId,
+        # jadi aman diantrikan ulang selama order-nya memang ada.
+        exists = await db.orders.find_one({"orderId": order_id, "paymentStatus": "SUCCESS"}, {"_id": 1})
+        if not exists:
+            logger.info(f"midtrans webhook: order {order_id} not found, ignored")
+            return
+    await email_outbox.enqueue_order_email(db, order_id)
@@ -104,20 +104,20 @@ async def seed_exclusive_ebooks():
     
     try:
         # Drop existing collection
-        await db.ebooks_exclusive.drop()
-        print("✓ Dropped existing ebooks_exclusive collection")
+        await db.exclusive_ebooks.drop()
+        print("✓ Dropped existing exclusive_ebooks collection")
         
         # Insert exclusive ebooks
         if exclusive_ebooks_data:
-            result = await db.ebooks_exclusive.insert_many(exclusive_ebooks_data)
+            result = await db.exclusive_ebooks.insert_many(exclusive_ebooks_data)
             print(f"✓ Inserted {len(result.inserted_ids)} exclusive ebooks")
         
         # Verify
-        count = await db.ebooks_exclusive.count_documents({})
+        count = await db.exclusive_ebooks.count_documents({})
         print(f"✓ Total exclusive ebooks in database: {count}")
         
         # Sample exclusive ebook
-        sample = await db.ebooks_exclusive.find_one({})
+        sample = await db.exclusive_ebooks.find_one({})
         if sample:
             print(f"\n📚 Sample exclusive ebook:")
             print(f"   ID: {sample['id']}")
@@ -6,7 +6,6 @@ from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
 import logging
-import subprocess
 import os
 import importlib
 from typing import Optional
@@ -166,6 +165,7 @@ include_router_safe("routes.webhooks")
 include_router_safe("routes.proxy")
 include_router_safe("routes.admin")
 include_router_safe("routes.test_notifications")
+include_router_safe("routes.game_access")
 
 # Daftarkan API group ke app (setelah middleware terpasang)
 app.include_router(api)
@@ -178,30 +178,135 @@ async def startup_db_seed():
     if db is None:
         logger.error("Skip auto-seed: DB not initialized")
         return
+    # seed koleksi katalog yang masih kosong di background (services/seeding.py);
+    # server langsung siap menerima request
+    from services.seeding import start_auto_seed
+    start_auto_seed(db)
+
+# -----------------------------------------------------------------------------
+# Startup: pastikan semua index ada (background, lihat services/indexes.py)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_indexes():
+    if db is None:
+        logger.error("Skip index bootstrap: DB not initialized")
+        return
+    from services.indexes import start_index_bootstrap
+    start_index_bootstrap(db)
+
+# -----------------------------------------------------------------------------
+# Startup: warm catalog cache + change stream invalidation
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_catalog_cache():
+    if db is None:
+        logger.error("Skip catalog cache warmup: DB not initialized")
+        return
+    from services.catalog_cache import catalog_cache
     try:
-        ebook_count = await db.ebooks.count_documents({})
-        minigame_count = await db.minigames.count_documents({})
-        exclusive_count = await db.exclusive_ebooks.count_documents({})
-
-        logger.info(
-            f"Database status: {ebook_count} ebooks, "
-            f"{minigame_count} minigames, {exclusive_count} exclusive ebooks"
-        )
-
-        if ebook_count == 0:
-            logger.info("Empty database detected, triggering auto-seed...")
-            subprocess.run([os.sys.executable, "/app/backend/seed_db.py"], cwd="/app/backend", check=False)
-            subprocess.run([os.sys.executable, "/app/backend/seed_minigames.py"], cwd="/app/backend", check=False)
-            subprocess.run([os.sys.executable, "/app/backend/seed_exclusive_ebooks.py"], cwd="/app/backend", check=False)
-            logger.info("Auto-seed completed")
+        await catalog_cache.reload(db)
     except Exception as e:
-        logger.error(f"Error during startup seed check: {e}")
+        logger.error(f"Catalog cache warmup failed (will retry on first request): {e}")
+    catalog_cache.start_watch(db)
+
+# -----------------------------------------------------------------------------
+# Startup: rekonsiliasi status pembayaran (webhook yang terlewat)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_payment_reconciler():
+    if db is None:
+        logger.error("Skip payment reconciler: DB not initialized")
+        return
+    from services.midtrans_service import midtrans_service
+    from services.reconciliation import start_reconciler
+    start_reconciler(db, midtrans_service)
+
+# -----------------------------------------------------------------------------
+# Startup: sweeper order pending yang ditinggalkan (-> expired)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_order_sweeper():
+    if db is None:
+        logger.error("Skip pending order sweeper: DB not initialized")
+        return
+    from services.order_expiry import start_order_sweeper
+    start_order_sweeper(db)
+
+# -----------------------------------------------------------------------------
+# Startup: worker pool email outbox
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_email_outbox():
+    if db is None:
+        logger.error("Skip email outbox workers: DB not initialized")
+        return
+    from services.email_outbox import email_outbox
+    email_outbox.start(db)
+
+# -----------------------------------------------------------------------------
+# Startup: payment event writer (riwayat Midtrans -> koleksi payments)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_payment_events():
+    if db is None:
+        logger.error("Skip payment event writer: DB not initialized")
+        return
+    from services.payment_events import payment_events
+    payment_events.start(db)
+
+# -----------------------------------------------------------------------------
+# Startup: change stream status order (SSE /orders/{order_id}/events)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_order_events():
+    if db is None:
+        logger.error("Skip order events change stream: DB not initialized")
+        return
+    from services.order_events import order_events
+    order_events.start_watch(db)
+
+# -----------------------------------------------------------------------------
+# Startup: counter akses game (write-behind ke game_access_tokens)
+# -----------------------------------------------------------------------------
+@app.on_event("startup")
+async def startup_access_counter():
+    if db is None:
+        logger.error("Skip game access counter: DB not initialized")
+        return
+    from services.access_counter import access_counter
+    access_counter.start(db)
 
 # -----------------------------------------------------------------------------
 # Shutdown
 # -----------------------------------------------------------------------------
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    from services.catalog_cache import catalog_cache
+    from services.midtrans_service import midtrans_service
+    from services.reconciliation import stop_reconciler
+    from services.email_outbox import email_outbox
+    from services.bulk_resend import stop_resend_jobs
+    from services.indexes import stop_index_bootstrap
+    from services.seeding import stop_auto_seed
+    from services.order_expiry import stop_order_sweeper
+    await stop_index_bootstrap()
+    await stop_auto_seed()
+    await catalog_cache.stop_watch()
+    from services.order_events import order_events
+    await order_events.stop_watch()
+    await stop_reconciler()
+    await stop_order_sweeper()
+    # job resend yang terputus bisa dilanjutkan dari checkpoint-nya
+    await stop_resend_jobs()
+    await email_outbox.stop()
+    # event yang masih di buffer ditulis sebelum client Mongo ditutup
+    from services.payment_events import payment_events
+    await payment_events.stop()
+    from services.access_counter import access_counter
+    await access_counter.stop()
+    from services.mail_transport import close_all_transports
+    await close_all_transports()
+    await midtrans_service.aclose()
     try:
         if client is not None:
             client.close()
@@ -0,0 +1,143 @@
+"""
+Agregasi write-behind untuk `game_access_tokens.accessCount`.
+
+Setiap verifikasi token yang berhasil (routes/game_access.py) hanya menambah
+counter di memori. Secara berkala semua counter ditulis dengan satu
+`bulk_write` berisi `$inc` per token (upsert: dokumen dibuat saat akses
+pertama, field token diisi lewat `$setOnInsert`). Counter yang gagal ditulis
+digabung kembali dan dicoba lagi, dan sisa counter di-flush saat shutdown.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.game_access import GameAccessClaims
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKENS_COLLECTION = "game_access_tokens"
+
+ACCESS_COUNTER_FLUSH_SECONDS = float(os.environ.get("ACCESS_COUNTER_FLUSH_SECONDS", "10"))
+
+
+@dataclass
+class _PendingCount:
+    claims: GameAccessClaims
+    count: int = 0
+    last_accessed: datetime = field(default_factory=datetime.utcnow)
+
+    def merge(self, other: "_PendingCount") -> None:
+        self.count += other.count
+        self.last_accessed = max(self.last_accessed, other.last_accessed)
+
+
+class AccessCounter:
+    def __init__(self, flush_interval: float = ACCESS_COUNTER_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._db = None
+        self._pending: Dict[str, _PendingCount] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, claims: GameAccessClaims) -> None:
+        entry = self._pending.get(claims.token_id)
+        if entry is None:
+            entry = self._pending[claims.token_id] = _PendingCount(claims)
+        entry.count += 1
+        entry.last_accessed = datetime.utcnow()
+
+    def _requeue(self, entries: Dict[str, _PendingCount]) -> None:
+        for token_id, entry in entries.items():
+            current = self._pending.get(token_id)
+            if current is None:
+                self._pending[token_id] = entry
+            else:
+                current.merge(entry)
+
+    @staticmethod
+    def _operation(token_id: str, entry: _PendingCount) -> UpdateOne:
+        claims = entry.claims
+        return UpdateOne(
+            {"tokenId": token_id},
+            {
+                "$inc": {"accessCount": entry.count},
+                "$max": {"lastAccessedAt": entry.last_accessed},
+                "$setOnInsert": {
+                    "orderId": claims.order_id,
+                    "gameIds": list(claims.game_ids),
+                    "expiresAt": claims.expires_at_datetime,
+                    "isActive": True,
+                    "createdAt": datetime.utcnow(),
+                },
+            },
+            upsert=True,
+        )
+
+    async def flush(self) -> Tuple[int, int]:
+        """Tulis semua counter; return (jumlah token, jumlah akses)."""
+        if self._db is None:
+            return 0, 0
+        async with self._lock:
+            if not self._pending:
+                return 0, 0
+            batch, self._pending = self._pending, {}
+            token_ids = list(batch)
+            ops = [self._operation(token_id, batch[token_id]) for token_id in token_ids]
+            failed: Dict[str, _PendingCount] = {}
+            try:
+                await self._db[ACCESS_TOKENS_COLLECTION].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # mis. upsert bersamaan dari worker lain (duplicate tokenId): coba lagi nanti
+                errors = e.details.get("writeErrors", [])
+                failed = {token_ids[err["index"]]: batch[token_ids[err["index"]]] for err in errors}
+                self._requeue(failed)
+                logger.warning(f"Access counter flush: {len(failed)} of {len(ops)} updates will be retried")
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                self._requeue(batch)
+                logger.error(f"Access counter flush failed: {e}")
+                return 0, 0
+            written = [entry for token_id, entry in batch.items() if token_id not in failed]
+            return len(written), sum(entry.count for entry in written)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Access counter flusher error: {e}")
+
+    def start(self, db) -> None:
+        self._db = db
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # jangan batalkan di tengah bulk_write ($inc yang sudah terkirim bisa terhitung dua kali)
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tokens, hits = await self.flush()
+        if self._pending:
+            logger.error(f"{len(self._pending)} game access counters not written on shutdown")
+        elif hits:
+            logger.info(f"Flushed {hits} game accesses for {tokens} tokens on shutdown")
+
+
+access_counter = AccessCounter()
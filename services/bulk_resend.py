@@ -0,0 +1,236 @@
+"""
+Kirim ulang (backfill) email order yang sudah dibayar dalam rentang waktu.
+
+Dipakai misalnya setelah `driveDownloadLink` diganti. Order dibaca per batch
+dengan keyset (createdAt, _id), sesuai index orders (paymentStatus, createdAt,
+_id), jadi tiap batch mulai tepat setelah batch sebelumnya tanpa memindai
+ulang rentang waktunya (tidak ada cursor panjang yang bisa timeout selama
+SMTP lambat, dan memori tetap O(batch)). Produk tiap batch di-join sekaligus,
+lalu email dikirim paralel (dibatasi konkurensi + rate limit). Setelah satu
+batch selesai, posisi keyset terakhir disimpan di `job_checkpoints` sehingga
+job yang terputus bisa dilanjutkan dengan job_id yang sama.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from routes.email_service import send_order_email, smtp_transport
+from services.product_join import resolve_products_for_orders
+from services.reconciliation import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = "job_checkpoints"
+
+RESEND_BATCH_SIZE = int(os.environ.get("RESEND_BATCH_SIZE", "200"))
+RESEND_CONCURRENCY = int(os.environ.get("RESEND_CONCURRENCY", "4"))
+RESEND_RATE_PER_SECOND = float(os.environ.get("RESEND_RATE_PER_SECOND", "5"))
+# daftar order gagal di checkpoint dibatasi agar dokumen tidak membengkak
+RESEND_MAX_FAILED_IDS = 1000
+
+ORDER_PROJECTION = {"orderId": 1, "customerEmail": 1, "items": 1, "createdAt": 1}
+KEYSET_SORT = [("createdAt", 1), ("_id", 1)]
+
+
+def order_query(since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"paymentStatus": "SUCCESS"}
+    window: Dict[str, Any] = {}
+    if since is not None:
+        window["$gte"] = since
+    if until is not None:
+        window["$lt"] = until
+    if window:
+        query["createdAt"] = window
+    return query
+
+
+def after_position(query: Dict[str, Any], last_created: Optional[datetime], last_id) -> Dict[str, Any]:
+    """Query untuk order sesudah posisi keyset (createdAt, _id) terakhir."""
+    if last_id is None:
+        return query
+    if last_created is None:
+        # checkpoint lama (keyset _id saja)
+        return {**query, "_id": {"$gt": last_id}}
+    window = {**query.get("createdAt", {}), "$gte": last_created}
+    return {
+        **query,
+        "createdAt": window,
+        "$or": [{"createdAt": {"$gt": last_created}}, {"_id": {"$gt": last_id}}],
+    }
+
+
+async def get_checkpoint(db, job_id: str) -> Optional[Dict[str, Any]]:
+    return await db[CHECKPOINT_COLLECTION].find_one({"_id": job_id})
+
+
+def _sends_email(checkpoint: Optional[Dict[str, Any]], dry_run: bool) -> bool:
+    # job yang dilanjutkan memakai dryRun dari checkpoint, bukan argumen run ini
+    if checkpoint is None:
+        return not dry_run
+    if checkpoint.get("status") == "completed":
+        return False
+    return not checkpoint.get("dryRun", dry_run)
+
+
+async def resend_requires_smtp(db, job_id: str, *, dry_run: bool = False, restart: bool = False) -> bool:
+    """True bila run ini (baru atau lanjutan) benar-benar akan mengirim email."""
+    checkpoint = None if restart else await get_checkpoint(db, job_id)
+    return _sends_email(checkpoint, dry_run)
+
+
+async def _save_checkpoint(db, job_id: str, last_created: Optional[datetime], last_id,
+                           counts: Dict[str, int], failed: List[str]) -> None:
+    update: Dict[str, Any] = {
+        "$set": {"lastCreatedAt": last_created, "lastId": last_id, "updatedAt": datetime.utcnow()},
+        "$inc": counts,
+    }
+    if failed:
+        update["$push"] = {"failedOrderIds": {"$each": failed, "$slice": -RESEND_MAX_FAILED_IDS}}
+    await db[CHECKPOINT_COLLECTION].update_one({"_id": job_id}, update)
+
+
+async def resend_order_emails(
+    db,
+    job_id: str,
+    *,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = RESEND_BATCH_SIZE,
+    concurrency: int = RESEND_CONCURRENCY,
+    rate_per_second: float = RESEND_RATE_PER_SECOND,
+    dry_run: bool = False,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """
+    Jalankan (atau lanjutkan) job resend. Rentang waktu dikunci di checkpoint
+    pada run pertama; run berikutnya dengan job_id sama memakai rentang itu.
+    Return dokumen checkpoint terakhir.
+    """
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    checkpoint = None if restart else await get_checkpoint(db, job_id)
+    if _sends_email(checkpoint, dry_run) and not smtp_transport.configured:
+        raise RuntimeError("SMTP is not configured (SMTP_HOST/SMTP_USER/SMTP_PASS)")
+    if checkpoint is None:
+        now = datetime.utcnow()
+        checkpoint = {
+            "_id": job_id,
+            "kind": "resend_order_emails",
+            "since": since,
+            "until": until,
+            "dryRun": dry_run,
+            "lastCreatedAt": None,
+            "lastId": None,
+            "sent": 0,
+            "would_send": 0,
+            "failed": 0,
+            "skipped": 0,
+            "failedOrderIds": [],
+            "status": "running",
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        await checkpoints.replace_one({"_id": job_id}, checkpoint, upsert=True)
+    elif checkpoint.get("status") == "completed":
+        return checkpoint
+    else:
+        await checkpoints.update_one({"_id": job_id}, {"$set": {"status": "running", "error": None}})
+
+    query = order_query(checkpoint.get("since"), checkpoint.get("until"))
+    dry_run = checkpoint.get("dryRun", dry_run)
+    last_created = checkpoint.get("lastCreatedAt")
+    last_id = checkpoint.get("lastId")
+    limiter = RateLimiter(rate_per_second)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _send(order: Dict[str, Any], products: List[Dict[str, Any]]) -> str:
+        email = order.get("customerEmail")
+        if not email or not products:
+            return "skipped"
+        if dry_run:
+            return "would_send"
+        async with semaphore:
+            await limiter.wait()
+            try:
+                await send_order_email(to_email=email, order=order, products=products)
+                return "sent"
+            except Exception as e:
+                logger.warning(f"Resend {job_id}: order {order.get('orderId')} failed: {e}")
+                return "failed"
+
+    try:
+        while True:
+            q = after_position(query, last_created, last_id)
+            batch = await db.orders.find(q, ORDER_PROJECTION).sort(KEYSET_SORT).limit(batch_size).to_list(length=batch_size)
+            if not batch:
+                break
+
+            products = await resolve_products_for_orders(db, batch)
+            outcomes = await asyncio.gather(*(_send(o, products.get(o.get("orderId"), [])) for o in batch))
+
+            counts = {"sent": 0, "would_send": 0, "failed": 0, "skipped": 0}
+            failed: List[str] = []
+            for order, outcome in zip(batch, outcomes):
+                counts[outcome] += 1
+                if outcome == "failed":
+                    failed.append(order.get("orderId"))
+            last_created, last_id = batch[-1].get("createdAt"), batch[-1]["_id"]
+            await _save_checkpoint(db, job_id, last_created, last_id, counts, failed)
+            logger.info(f"Resend {job_id}: batch done up to {last_id} {counts}")
+
+            if len(batch) < batch_size:
+                break
+    except asyncio.CancelledError:
+        await checkpoints.update_one({"_id": job_id}, {"$set": {"status": "paused", "updatedAt": datetime.utcnow()}})
+        raise
+    except Exception as e:
+        await checkpoints.update_one(
+            {"_id": job_id}, {"$set": {"status": "error", "error": str(e), "updatedAt": datetime.utcnow()}}
+        )
+        raise
+
+    await checkpoints.update_one(
+        {"_id": job_id},
+        {"$set": {"status": "completed", "completedAt": datetime.utcnow(), "updatedAt": datetime.utcnow()}},
+    )
+    return await get_checkpoint(db, job_id)
+
+
+# ---------------------------------------------------------------------
+# Background jobs (admin endpoint)
+# ---------------------------------------------------------------------
+_jobs: Dict[str, asyncio.Task] = {}
+
+
+def start_resend_job(db, job_id: str, **kwargs) -> bool:
+    """Jalankan job di background; False bila job_id yang sama masih berjalan."""
+    task = _jobs.get(job_id)
+    if task is not None and not task.done():
+        return False
+
+    async def _run():
+        try:
+            await resend_order_emails(db, job_id, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Resend job {job_id} failed: {e}")
+
+    task = asyncio.create_task(_run())
+    _jobs[job_id] = task
+    task.add_done_callback(lambda t: _jobs.pop(job_id, None) if _jobs.get(job_id) is t else None)
+    return True
+
+
+def is_running(job_id: str) -> bool:
+    task = _jobs.get(job_id)
+    return task is not None and not task.done()
+
+
+async def stop_resend_jobs() -> None:
+    tasks = list(_jobs.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
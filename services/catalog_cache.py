@@ -0,0 +1,281 @@
+"""
+In-process catalog cache for ebooks, minigames and exclusive ebooks.
+
+Katalog hanya berubah lewat endpoint admin atau seed script, jadi seluruh isi
+tiga koleksi disimpan di memori dan listing dilayani tanpa round trip ke Mongo.
+Cache di-invalidate oleh:
+  - endpoint mutasi di routes/admin.py (invalidate())
+  - Mongo change stream (watch) untuk perubahan dari worker/script lain
+  - umur maksimum (CATALOG_CACHE_TTL) sebagai jaring pengaman bila change
+    stream tidak tersedia (mis. Mongo standalone tanpa replica set)
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import Ebook
+from services.pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# productType -> nama koleksi
+CATALOG_COLLECTIONS: Dict[str, str] = {
+    "ebook": "ebooks",
+    "minigame": "minigames",
+    "ebook_exclusive": "exclusive_ebooks",
+}
+
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "300"))
+
+
+# nilai filter yang berarti "tanpa filter"
+ALL = "all"
+
+IndexKey = Tuple[str, str, str]  # (productType, ageGroup, category)
+
+
+def normalize_product_type(product_type: Optional[str]) -> str:
+    """Tipe yang tidak dikenal jatuh ke koleksi ebooks (perilaku lama get_ebooks)."""
+    return product_type if product_type in CATALOG_COLLECTIONS else "ebook"
+
+
+def _filter_value(value: Optional[str]) -> str:
+    return value if value else ALL
+
+
+def render_json(payload: Any) -> bytes:
+    """Encoding identik dengan JSONResponse FastAPI."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _serialize(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Bentuk response final (setara response_model=Ebook), dihitung sekali per reload."""
+    try:
+        return Ebook.model_validate(doc).model_dump(mode="json")
+    except Exception as e:
+        logger.warning(f"Catalog item {doc.get('id')} skipped, invalid shape: {e}")
+        return None
+
+
+def _build_index(
+    items_by_type: Dict[str, Dict[int, Dict[str, Any]]],
+    docs_by_type: Dict[str, Dict[int, Dict[str, Any]]],
+) -> Dict[IndexKey, List[Dict[str, Any]]]:
+    """
+    Inverted index (productType, ageGroup, category) -> list item siap kirim.
+    Tiap item masuk ke 4 key: kombinasi nilai aslinya dan wildcard "all".
+    Bonus ebook dibuang di sini, bukan per request.
+    """
+    index: Dict[IndexKey, List[Dict[str, Any]]] = {}
+    for product_type, items in items_by_type.items():
+        index[(product_type, ALL, ALL)] = []
+        for product_id, item in items.items():
+            doc = docs_by_type[product_type][product_id]
+            if product_type == "ebook" and doc.get("isBonus", False):
+                continue
+            age_group = doc.get("ageGroup")
+            category = doc.get("category")
+            keys = {
+                (product_type, ALL, ALL),
+                (product_type, _filter_value(age_group), ALL),
+                (product_type, ALL, _filter_value(category)),
+                (product_type, _filter_value(age_group), _filter_value(category)),
+            }
+            for key in keys:
+                index.setdefault(key, []).append(item)
+    return index
+
+
+class CatalogCache:
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._docs: Dict[str, Dict[int, Dict[str, Any]]] = {t: {} for t in CATALOG_COLLECTIONS}
+        self._items: Dict[str, Dict[int, Dict[str, Any]]] = {t: {} for t in CATALOG_COLLECTIONS}
+        self._index: Dict[IndexKey, List[Dict[str, Any]]] = {}
+        # bytes JSON per listing/item, dirender sekali per versi katalog
+        self._rendered: Dict[Any, bytes] = {}
+        self.etag = '"catalog-0"'
+        self._loaded_at: Optional[float] = None
+        # naik setiap invalidate(): reload yang membaca data sebelum perubahan
+        # tidak boleh menandai cache segar
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Load / invalidate
+    # ------------------------------------------------------------------
+    @property
+    def is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return (time.monotonic() - self._loaded_at) < self.ttl
+
+    def invalidate(self) -> None:
+        """Tandai cache basi; reload terjadi pada request berikutnya."""
+        self._generation += 1
+        self._loaded_at = None
+
+    async def reload(self, db) -> None:
+        generation = self._generation
+
+        async def _fetch(product_type: str, collection: str):
+            docs = await db[collection].find({}, {"_id": 0}).to_list(length=None)
+            return product_type, docs
+
+        results = await asyncio.gather(
+            *(_fetch(t, c) for t, c in CATALOG_COLLECTIONS.items())
+        )
+
+        docs_by_type: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for product_type, docs in results:
+            docs_by_type[product_type] = {
+                d["id"]: d for d in sorted(docs, key=lambda d: d.get("id", 0)) if "id" in d
+            }
+
+        items_by_type: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for product_type, docs in docs_by_type.items():
+            items_by_type[product_type] = {}
+            for product_id, doc in docs.items():
+                item = _serialize(doc)
+                if item is not None:
+                    items_by_type[product_type][product_id] = item
+
+        self._docs = docs_by_type
+        self._items = items_by_type
+        self._index = _build_index(items_by_type, docs_by_type)
+        self._rendered = {}
+        self.version += 1
+        # ETag dari isi katalog (bukan counter) agar konsisten antar worker
+        digest = hashlib.sha256(render_json(
+            {t: list(items.values()) for t, items in items_by_type.items()}
+        )).hexdigest()[:20]
+        self.etag = f'"catalog-{digest}"'
+        # invalidate() selama reload: data ini mungkin sudah basi, reload lagi di request berikutnya
+        self._loaded_at = time.monotonic() if generation == self._generation else None
+        logger.info(
+            "Catalog cache loaded (v%s): %s",
+            self.version,
+            ", ".join(f"{t}={len(d)}" for t, d in docs_by_type.items()),
+        )
+
+    async def ensure_loaded(self, db) -> None:
+        if self.is_fresh:
+            return
+        async with self._lock:
+            # request lain mungkin sudah reload saat kita menunggu lock
+            if not self.is_fresh:
+                await self.reload(db)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def list_products(
+        self,
+        product_type: Optional[str],
+        age_group: Optional[str] = None,
+        category: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        key = (
+            normalize_product_type(product_type),
+            _filter_value(age_group),
+            _filter_value(category),
+        )
+        return self._index.get(key, [])
+
+    def page_products(
+        self,
+        product_type: Optional[str],
+        age_group: Optional[str] = None,
+        category: Optional[str] = None,
+        *,
+        limit: int,
+        after: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Keyset page di atas listing terindeks (sudah urut id)."""
+        items = self.list_products(product_type, age_group, category)
+        start = 0 if after is None else bisect.bisect_right(items, after, key=lambda it: it["id"])
+        page = items[start:start + limit]
+        has_more = start + limit < len(items)
+        next_cursor = encode_cursor(page[-1]["id"]) if has_more and page else None
+        if fields:
+            page = [{f: it.get(f) for f in fields} for it in page]
+        return page, next_cursor
+
+    def get_product(self, product_type: Optional[str], product_id: int) -> Optional[Dict[str, Any]]:
+        """Item siap kirim (sudah lewat model Ebook)."""
+        return self._items[normalize_product_type(product_type)].get(product_id)
+
+    def get_document(self, product_type: Optional[str], product_id: int) -> Optional[Dict[str, Any]]:
+        """Dokumen mentah dari Mongo (tanpa _id), termasuk field di luar model."""
+        return self._docs[normalize_product_type(product_type)].get(product_id)
+
+    def render_products(
+        self,
+        product_type: Optional[str],
+        age_group: Optional[str] = None,
+        category: Optional[str] = None,
+    ) -> bytes:
+        key = (
+            normalize_product_type(product_type),
+            _filter_value(age_group),
+            _filter_value(category),
+        )
+        body = self._rendered.get(key)
+        if body is None:
+            body = self._rendered[key] = render_json(self._index.get(key, []))
+        return body
+
+    def render_product(self, product_type: Optional[str], product_id: int) -> Optional[bytes]:
+        item = self.get_product(product_type, product_id)
+        if item is None:
+            return None
+        key = ("item", normalize_product_type(product_type), product_id)
+        body = self._rendered.get(key)
+        if body is None:
+            body = self._rendered[key] = render_json(item)
+        return body
+
+    # ------------------------------------------------------------------
+    # Change stream
+    # ------------------------------------------------------------------
+    async def _watch(self, db) -> None:
+        pipeline = [{"$match": {"ns.coll": {"$in": list(CATALOG_COLLECTIONS.values())}}}]
+        try:
+            async with db.watch(pipeline) as stream:
+                logger.info("Catalog change stream started")
+                async for change in stream:
+                    logger.info(
+                        "Catalog change detected (%s on %s), invalidating cache",
+                        change.get("operationType"),
+                        (change.get("ns") or {}).get("coll"),
+                    )
+                    self.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Mongo standalone tidak mendukung change stream; TTL tetap berlaku
+            logger.warning(f"Catalog change stream unavailable, relying on TTL={self.ttl}s: {e}")
+
+    def start_watch(self, db) -> None:
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch(db))
+
+    async def stop_watch(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+catalog_cache = CatalogCache()
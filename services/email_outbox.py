@@ -0,0 +1,196 @@
+"""
+Outbox email yang durable + worker pool async.
+
+Webhook hanya menulis satu dokumen ke koleksi `email_outbox` lalu langsung
+membalas Midtrans; pengiriman SMTP dilakukan worker di background dengan
+retry + exponential backoff. _id dokumen adalah idempotency key
+("order_paid:<orderId>"), jadi notifikasi/retry Midtrans yang berulang tidak
+menghasilkan email ganda.
+
+Selama SMTP belum dikonfigurasi worker tidak mengambil job sama sekali (job
+tetap pending, tidak menghabiskan attempt). Job yang tidak mungkin terkirim
+(order hilang, order tanpa customerEmail) langsung `failed` tanpa retry. Job yang terkirim dihapus TTL
+index `sentAt` (services/indexes.py).
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from routes.email_service import send_order_email, smtp_transport
+from services.product_join import resolve_order_products
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "email_outbox"
+KIND_ORDER_PAID = "order_paid"
+
+OUTBOX_WORKERS = int(os.environ.get("EMAIL_OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.environ.get("EMAIL_OUTBOX_BACKOFF_BASE", "30"))  # detik
+OUTBOX_BACKOFF_MAX = float(os.environ.get("EMAIL_OUTBOX_BACKOFF_MAX", "3600"))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("EMAIL_OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", "10"))
+
+
+def outbox_id(kind: str, order_id: str) -> str:
+    return f"{kind}:{order_id}"
+
+
+class UndeliverableEmail(ValueError):
+    """Job yang tidak akan pernah berhasil walau di-retry."""
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff dengan jitter: base * 2^(n-1), dibatasi max."""
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class EmailOutbox:
+    def __init__(self, workers: int = OUTBOX_WORKERS):
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    # ------------------------------------------------------------------
+    # Producer
+    # ------------------------------------------------------------------
+    async def enqueue_order_email(self, db, order_id: str) -> bool:
+        """
+        Antrikan email "order paid". Idempotent per orderId:
+        return False bila sudah pernah diantrikan.
+        """
+        now = datetime.utcnow()
+        try:
+            result = await db[OUTBOX_COLLECTION].update_one(
+                {"_id": outbox_id(KIND_ORDER_PAID, order_id)},
+                {"$setOnInsert": {
+                    "kind": KIND_ORDER_PAID,
+                    "orderId": order_id,
+                    "status": "pending",
+                    "attempts": 0,
+                    "nextAttemptAt": now,
+                    "leaseUntil": None,
+                    "lastError": None,
+                    "createdAt": now,
+                    "updatedAt": now,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # upsert bersamaan dari request lain
+            return False
+        if result.upserted_id is None:
+            return False
+        self._wakeup.set()
+        return True
+
+    # ------------------------------------------------------------------
+    # Consumer
+    # ------------------------------------------------------------------
+    async def _claim(self, db) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await db[OUTBOX_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": "pending", "nextAttemptAt": {"$lte": now}},
+                # worker lain mati di tengah pengiriman: ambil alih setelah lease habis
+                {"status": "sending", "leaseUntil": {"$lte": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "sending",
+                    "leaseUntil": now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    "updatedAt": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _deliver(self, db, job: Dict[str, Any]) -> None:
+        order = await db.orders.find_one({"orderId": job["orderId"]})
+        if not order:
+            raise UndeliverableEmail(f"order {job['orderId']} not found")
+        if not order.get("customerEmail"):
+            raise UndeliverableEmail(f"order {job['orderId']} has no customerEmail")
+        products = await resolve_order_products(db, order)
+        await send_order_email(
+            to_email=order.get("customerEmail"),
+            order=order,
+            products=products,
+        )
+
+    async def _process(self, db, job: Dict[str, Any]) -> None:
+        now = datetime.utcnow()
+        try:
+            await self._deliver(db, job)
+        except Exception as e:
+            attempts = job.get("attempts", 1)
+            if isinstance(e, UndeliverableEmail):
+                update = {"status": "failed"}
+                logger.error(f"Email {job['_id']} cannot be delivered, not retrying: {e}")
+            elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                update = {"status": "failed"}
+                logger.error(f"Email {job['_id']} failed permanently after {attempts} attempts: {e}")
+            else:
+                update = {
+                    "status": "pending",
+                    "nextAttemptAt": now + timedelta(seconds=backoff_seconds(attempts)),
+                }
+                logger.warning(f"Email {job['_id']} attempt {attempts} failed, will retry: {e}")
+            await db[OUTBOX_COLLECTION].update_one(
+                {"_id": job["_id"]},
+                {"$set": {**update, "leaseUntil": None, "lastError": str(e), "updatedAt": now}},
+            )
+            return
+
+        await db[OUTBOX_COLLECTION].update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "sent", "sentAt": now, "leaseUntil": None, "lastError": None, "updatedAt": now}},
+        )
+        logger.info(f"Email {job['_id']} sent")
+
+    async def _worker(self, db, n: int) -> None:
+        while True:
+            try:
+                self._wakeup.clear()
+                if not smtp_transport.configured:
+                    await asyncio.sleep(OUTBOX_POLL_SECONDS)
+                    continue
+                job = await self._claim(db)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email outbox worker {n} error: {e}")
+                await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+    def start(self, db) -> None:
+        if self._tasks:
+            return
+        if not smtp_transport.configured:
+            logger.error("SMTP is not configured: email outbox jobs stay pending until it is")
+        self._tasks = [asyncio.create_task(self._worker(db, n)) for n in range(self.workers)]
+        logger.info(f"Email outbox started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+email_outbox = EmailOutbox()
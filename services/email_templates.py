@@ -0,0 +1,414 @@
+"""
+Template email yang dikompilasi sekali saat import.
+
+Setiap template adalah `string.Template` (placeholder `$nama`) yang diparse
+satu kali; render hanya substitusi + `"".join` atas baris item, tanpa
+konkatenasi `+=`. Nilai yang masuk ke template HTML selalu di-escape
+(`html.escape`), kecuali fragmen yang sudah dirender template lain
+(`SafeHtml`). Baris per produk di-cache (LRU) karena pada resend massal
+judul + link produk yang sama muncul di ribuan email.
+"""
+import html
+from functools import lru_cache
+from string import Template
+from typing import Dict, List, Tuple
+
+ROW_CACHE_SIZE = 2048
+
+
+class SafeHtml(str):
+    """Fragmen HTML hasil render template: tidak di-escape lagi."""
+
+
+class TextTemplate:
+    """Template plain-text: nilai disubstitusi apa adanya."""
+
+    def __init__(self, source: str):
+        self._template = Template(source)
+        # validasi placeholder di awal, bukan saat email pertama dikirim
+        if not self._template.is_valid():
+            raise ValueError("Invalid email template")
+        self.placeholders = frozenset(self._template.get_identifiers())
+
+    def _prepare(self, values: Dict[str, object]) -> Dict[str, str]:
+        return {key: str(value) for key, value in values.items()}
+
+    def render(self, **values) -> str:
+        return self._template.substitute(self._prepare(values))
+
+
+class HtmlTemplate(TextTemplate):
+    """Template HTML: semua nilai di-escape kecuali `SafeHtml`."""
+
+    def _prepare(self, values: Dict[str, object]) -> Dict[str, str]:
+        return {
+            key: value if isinstance(value, SafeHtml) else html.escape(str(value), quote=True)
+            for key, value in values.items()
+        }
+
+    def render(self, **values) -> SafeHtml:
+        return SafeHtml(super().render(**values))
+
+
+def join_html(fragments) -> SafeHtml:
+    return SafeHtml("".join(fragments))
+
+
+# ---------------------------------------------------------------------
+# Potongan bersama
+# ---------------------------------------------------------------------
+_SIMPLE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+    <div style="text-align: center; padding: 20px; background: #667eea; color: white; border-radius: 8px;">
+        <h1 style="margin: 0; font-size: 24px;">Pelangi Pintar</h1>
+        <p style="margin: 5px 0 0 0;">Platform Edukasi Anak Indonesia</p>
+    </div>
+"""
+
+_TEXT_HEADER = """
+Pelangi Pintar - Platform Edukasi Anak Indonesia
+
+Halo $customer_name,
+
+Terima kasih atas pembelian Anda! Pembayaran telah berhasil diproses.
+
+Order ID: $order_id
+"""
+
+_TEXT_ITEM = TextTemplate("\n$index. $title\n   $url\n")
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _text_item(index: int, title: str, url: str) -> str:
+    return _TEXT_ITEM.render(index=index, title=title, url=url)
+
+
+# ---------------------------------------------------------------------
+# Email download ebook (services.notification_service.send_email)
+# ---------------------------------------------------------------------
+_EBOOK_ROW = HtmlTemplate("""
+        <tr>
+            <td style="padding: 12px; border-bottom: 1px solid #ddd;">
+                <strong>$index. $title</strong><br>
+                <a href="$url" style="color: #4CAF50; text-decoration: none; font-weight: 600;">
+                    Download Ebook
+                </a>
+            </td>
+        </tr>
+        """)
+
+_EBOOK_TEXT = TextTemplate(_TEXT_HEADER + """
+📚 DOWNLOAD EBOOK ANDA:
+$items
+💡 CATATAN PENTING:
+Link download bersifat permanen. Simpan email ini untuk akses kapan saja.
+
+Butuh bantuan?
+📧 pelangipintar@ebookanak.store
+📱 +62 823 6545 9989
+
+© 2025 Pelangi Pintar. All rights reserved.
+""")
+
+_EBOOK_HTML = HtmlTemplate(_SIMPLE_HEAD + """
+    <div style="padding: 20px; background: #f9f9f9; margin: 20px 0; border-radius: 8px;">
+        <h2 style="margin: 0 0 10px 0; font-size: 18px;">Halo, $customer_name!</h2>
+        <p style="margin: 0 0 10px 0;">Terima kasih atas pembelian Anda! Pembayaran telah berhasil diproses.</p>
+        <p style="margin: 0; color: #666;"><strong>Order ID:</strong> $order_id</p>
+    </div>
+
+    <h3 style="margin: 20px 0 10px 0;">📚 Ebook Anda</h3>
+    <table style="width: 100%; border-collapse: collapse;">
+        $rows
+    </table>
+
+    <div style="padding: 15px; background: #fffbea; border-left: 4px solid #ffc107; margin: 20px 0; border-radius: 4px;">
+        <p style="margin: 0 0 5px 0; font-weight: bold;">💡 Catatan Penting</p>
+        <p style="margin: 0;">Link download bersifat permanen. Simpan email ini untuk akses kapan saja.</p>
+    </div>
+
+    <div style="text-align: center; padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 20px;">
+        <p style="margin: 0 0 10px 0; font-weight: bold;">Butuh bantuan?</p>
+        <p style="margin: 0;">📧 pelangipintar@ebookanak.store</p>
+        <p style="margin: 5px 0 10px 0;">📱 +62 823 6545 9989</p>
+        <p style="margin: 0; color: #999; font-size: 12px;">© 2025 Pelangi Pintar</p>
+    </div>
+</body>
+</html>""")
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _ebook_row(index: int, title: str, url: str) -> SafeHtml:
+    return _EBOOK_ROW.render(index=index, title=title, url=url)
+
+
+def render_ebook_email(customer_name: str, order_id: str, ebooks: List[Dict]) -> Tuple[str, str]:
+    """Return (html, plain_text) untuk email link download ebook."""
+    items = [(i, str(e['title']), str(e['downloadLink'])) for i, e in enumerate(ebooks, 1)]
+    html_body = _EBOOK_HTML.render(
+        customer_name=customer_name,
+        order_id=order_id,
+        rows=join_html(_ebook_row(*item) for item in items),
+    )
+    plain_text = _EBOOK_TEXT.render(
+        customer_name=customer_name,
+        order_id=order_id,
+        items="".join(_text_item(*item) for item in items),
+    )
+    return html_body, plain_text
+
+
+# ---------------------------------------------------------------------
+# Email link mini game (services.notification_service.send_game_links_email)
+# ---------------------------------------------------------------------
+_GAME_LINK_ROW = HtmlTemplate("""
+            <tr>
+                <td style="padding: 12px; border-bottom: 1px solid #ddd;">
+                    <strong>$index. $title</strong><br>
+                    <a href="$url" style="color: #FF8B94; text-decoration: none; font-weight: 600;">
+                        Mainkan Game
+                    </a>
+                </td>
+            </tr>
+            """)
+
+_GAME_LINKS_TEXT = TextTemplate(_TEXT_HEADER + """Link berlaku: $expires_hours Jam
+
+MAINKAN GAME ANDA:
+$items
+CATATAN PENTING:
+- Link berlaku $expires_hours jam dari waktu pembelian
+- Game dapat dimainkan berulang kali dalam periode $expires_hours jam
+- Klik link untuk langsung bermain
+
+Butuh bantuan?
+📧 pelangipintar@ebookanak.store
+📱 +62 823 6545 9989
+
+© 2025 Pelangi Pintar
+""")
+
+_GAME_LINKS_HTML = HtmlTemplate(_SIMPLE_HEAD + """
+    <div style="padding: 20px; background: #f9f9f9; margin: 20px 0; border-radius: 8px;">
+        <h2 style="margin: 0 0 10px 0; font-size: 18px;">Halo, $customer_name!</h2>
+        <p style="margin: 0 0 10px 0;">Terima kasih atas pembelian Anda! Pembayaran telah berhasil diproses.</p>
+        <p style="margin: 0; color: #666;"><strong>Order ID:</strong> $order_id</p>
+        <p style="margin: 5px 0 0 0; color: #d84315;"><strong>Link berlaku: $expires_hours Jam</strong></p>
+    </div>
+
+    <h3 style="margin: 20px 0 10px 0;">Mini Game Anda</h3>
+    <table style="width: 100%; border-collapse: collapse;">
+        $rows
+    </table>
+
+    <div style="padding: 15px; background: #e8f5e9; border-left: 4px solid #4caf50; margin: 20px 0; border-radius: 4px;">
+        <p style="margin: 0 0 5px 0; font-weight: bold;">Catatan Penting</p>
+        <ul style="margin: 0; padding-left: 20px;">
+            <li>Link berlaku $expires_hours jam dari waktu pembelian</li>
+            <li>Game dapat dimainkan berulang kali</li>
+        </ul>
+    </div>
+
+    <div style="text-align: center; padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 20px;">
+        <p style="margin: 0 0 10px 0; font-weight: bold;">Butuh bantuan?</p>
+        <p style="margin: 0;">pelangipintar@ebookanak.store</p>
+        <p style="margin: 5px 0 10px 0;">+62 823 6545 9989</p>
+        <p style="margin: 0; color: #999; font-size: 12px;">© 2025 Pelangi Pintar</p>
+    </div>
+</body>
+</html>""")
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _game_link_row(index: int, title: str, url: str) -> SafeHtml:
+    return _GAME_LINK_ROW.render(index=index, title=title, url=url)
+
+
+def render_game_links_email(
+    customer_name: str, order_id: str, games: List[Dict], expires_hours: int, frontend_url: str
+) -> Tuple[str, str]:
+    """Return (html, plain_text); gameUrl relatif ('/...') diprefix frontend_url."""
+    items = []
+    for i, game in enumerate(games, 1):
+        game_url = game['gameUrl']
+        if game_url.startswith('/'):
+            game_url = f"{frontend_url}{game_url}"
+        items.append((i, str(game['title']), game_url))
+    html_body = _GAME_LINKS_HTML.render(
+        customer_name=customer_name,
+        order_id=order_id,
+        expires_hours=expires_hours,
+        rows=join_html(_game_link_row(*item) for item in items),
+    )
+    plain_text = _GAME_LINKS_TEXT.render(
+        customer_name=customer_name,
+        order_id=order_id,
+        expires_hours=expires_hours,
+        items="".join(_text_item(*item) for item in items),
+    )
+    return html_body, plain_text
+
+
+# ---------------------------------------------------------------------
+# Email token akses game (services.notification_service.send_game_access_email)
+# ---------------------------------------------------------------------
+_GAME_ACCESS_ROW = HtmlTemplate("""
+        <tr>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">
+                <span style="font-size: 24px;">🎮</span>
+                <span style="margin-left: 10px; color: #333; font-size: 16px;">Mini Game #$game_id</span>
+            </td>
+        </tr>
+        """)
+
+_GAME_ACCESS_HTML = HtmlTemplate("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    </head>
+    <body style="margin: 0; padding: 0; font-family: Arial, sans-serif; background-color: #f4f4f4;">
+        <table role="presentation" style="width: 100%; border-collapse: collapse;">
+            <tr>
+                <td style="padding: 40px 0; text-align: center; background: linear-gradient(135deg, #FFB6C1 0%, #E6E6FA 100%);">
+                    <h1 style="margin: 0; color: white; font-size: 32px; text-shadow: 2px 2px 4px rgba(0,0,0,0.1);">
+                        🌈 Pelangi Pintar
+                    </h1>
+                    <p style="margin: 10px 0 0 0; color: white; font-size: 16px;">
+                        Platform Edukasi Anak
+                    </p>
+                </td>
+            </tr>
+            <tr>
+                <td style="padding: 0;">
+                    <table role="presentation" style="width: 600px; margin: 40px auto; background-color: white; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); overflow: hidden; max-width: 100%;">
+                        <tr>
+                            <td style="padding: 40px 30px;">
+                                <h2 style="margin: 0 0 20px 0; color: #333; font-size: 24px;">
+                                    🎉 Halo, $customer_name!
+                                </h2>
+                                <p style="margin: 0 0 20px 0; color: #666; font-size: 16px; line-height: 1.6;">
+                                    Terima kasih atas pembelian Anda! Pembayaran telah berhasil diproses.
+                                </p>
+
+                                <div style="background-color: #FFF8E7; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                                    <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;">
+                                        <strong>Order ID:</strong> $order_id
+                                    </p>
+                                    <p style="margin: 0; color: #666; font-size: 14px;">
+                                        <strong>Akses Berlaku:</strong> $expires_in_hours Jam
+                                    </p>
+                                </div>
+
+                                <h3 style="margin: 30px 0 15px 0; color: #333; font-size: 20px;">
+                                    🎮 Game yang Tersedia:
+                                </h3>
+
+                                <table role="presentation" style="width: 100%; border-collapse: collapse; margin: 0 0 30px 0;">
+                                    $rows
+                                </table>
+
+                                <div style="text-align: center; margin: 30px 0;">
+                                    <a href="$access_link"
+                                       style="display: inline-block; padding: 16px 40px; background: linear-gradient(135deg, #FF8B94 0%, #FFB88C 100%);
+                                              color: white; text-decoration: none; border-radius: 30px; font-weight: bold; font-size: 18px;
+                                              box-shadow: 0 4px 15px rgba(255, 139, 148, 0.3);">
+                                        🚀 Mainkan Sekarang!
+                                    </a>
+                                </div>
+
+                                <div style="background-color: #F0FFFA; padding: 20px; border-radius: 8px; border-left: 4px solid #7FD8BE;">
+                                    <p style="margin: 0 0 10px 0; color: #333; font-size: 14px; font-weight: bold;">
+                                        💡 Catatan Penting:
+                                    </p>
+                                    <ul style="margin: 0; padding-left: 20px; color: #666; font-size: 14px; line-height: 1.8;">
+                                        <li>Link akses berlaku selama $expires_in_hours jam dari waktu pembelian</li>
+                                        <li>Simpan link ini untuk mengakses game kapan saja</li>
+                                        <li>Game dapat dimainkan berulang kali dalam periode akses</li>
+                                    </ul>
+                                </div>
+                            </td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 30px; background-color: #FFF5F7; text-align: center; border-top: 1px solid #FFB6C1;">
+                                <p style="margin: 0 0 15px 0; color: #666; font-size: 14px;">
+                                    Ada pertanyaan? Hubungi kami:
+                                </p>
+                                <p style="margin: 0; color: #FF8B94; font-size: 14px;">
+                                    📧 pelangipintar@ebookanak.store
+                                </p>
+                                <p style="margin: 10px 0 0 0; color: #666; font-size: 12px;">
+                                    © 2024 Pelangi Pintar. Semua hak dilindungi.
+                                </p>
+                            </td>
+                        </tr>
+                    </table>
+                </td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    """)
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _game_access_row(game_id: str) -> SafeHtml:
+    return _GAME_ACCESS_ROW.render(game_id=game_id)
+
+
+def render_game_access_email(
+    customer_name: str, order_id: str, access_link: str, games: List[Dict], expires_in_hours: int
+) -> str:
+    return _GAME_ACCESS_HTML.render(
+        customer_name=customer_name,
+        order_id=order_id,
+        expires_in_hours=expires_in_hours,
+        access_link=access_link,
+        rows=join_html(_game_access_row(str(game['id'])) for game in games),
+    )
+
+
+# ---------------------------------------------------------------------
+# Email order paid dari webhook/outbox (routes.email_service)
+# ---------------------------------------------------------------------
+_ORDER_PAID_INTRO = HtmlTemplate(
+    "<p>Terima kasih! Order <b>#$order_id</b> telah <b>berhasil dibayar</b>.</p>"
+)
+_ORDER_PAID_OUTRO = "<p>Jika tautan tidak berfungsi, balas email ini ya.</p>"
+_PRODUCT_LINK_ITEM = HtmlTemplate(
+    '<li>$title — <a href="$url" target="_blank" rel="noopener">$label</a></li>'
+)
+_PRODUCT_ITEM = HtmlTemplate("<li>$title</li>")
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _product_item(title: str, product_type: str, file_url: str, external_url: str) -> SafeHtml:
+    # Tampilkan tautan yang relevan
+    if product_type in ("ebook", "ebook_exclusive") and file_url:
+        return _PRODUCT_LINK_ITEM.render(title=title, url=file_url, label="Download")
+    if product_type == "minigame" and external_url:
+        return _PRODUCT_LINK_ITEM.render(title=title, url=external_url, label="Mainkan")
+    return _PRODUCT_ITEM.render(title=title)
+
+
+def render_order_paid_html(order: dict, products: List[dict]) -> str:
+    parts = [_ORDER_PAID_INTRO.render(order_id=order.get("orderId"))]
+    if products:
+        parts.append("<ul>")
+        parts.extend(
+            _product_item(
+                p.get("title") or "Produk",
+                p.get("product_type") or "ebook",
+                p.get("file_url") or "",
+                p.get("external_url") or "",
+            )
+            for p in products
+        )
+        parts.append("</ul>")
+    parts.append(_ORDER_PAID_OUTRO)
+    return "\n".join(parts)
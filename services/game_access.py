@@ -0,0 +1,224 @@
+"""
+Token akses mini game yang stateless (HMAC-SHA256), untuk /games/play?token=...
+
+Token = base64url(claims JSON) + "." + base64url(HMAC(claims)). Claims:
+  t: token id acak (kunci revokasi + cache)
+  g: daftar gameId
+  o: orderId
+  e: expiry (unix detik)
+
+Verifikasi tanda tangan + expiry murni CPU. Mongo hanya dipakai untuk cek
+revokasi (koleksi `game_access_revocations`, per token atau per order), dan
+hasilnya di-cache di LRU+TTL kecil sehingga reload game berulang tidak
+menyentuh database. Revokasi berlaku di worker lain paling lambat
+GAME_ACCESS_CACHE_TTL detik kemudian.
+
+Umur token dibatasi GAME_ACCESS_TTL_HOURS, sehingga entri revokasi per order
+(yang hidup selama itu) selalu lebih lama dari token mana pun. Tanpa
+GAME_ACCESS_SECRET fitur ini mati (GameAccessNotConfigured), bukan memakai
+kunci acak per proses.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REVOCATIONS_COLLECTION = "game_access_revocations"
+
+GAME_ACCESS_TTL_HOURS = float(os.environ.get("GAME_ACCESS_TTL_HOURS", "24"))
+GAME_ACCESS_CACHE_SIZE = int(os.environ.get("GAME_ACCESS_CACHE_SIZE", "10000"))
+GAME_ACCESS_CACHE_TTL = float(os.environ.get("GAME_ACCESS_CACHE_TTL", "60"))
+FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
+
+
+def _load_secret() -> Optional[bytes]:
+    secret = os.environ.get("GAME_ACCESS_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    logger.error("GAME_ACCESS_SECRET not set: game access tokens cannot be issued or verified")
+    return None
+
+
+class GameAccessNotConfigured(RuntimeError):
+    pass
+
+
+class InvalidGameToken(ValueError):
+    pass
+
+
+class RevokedGameToken(InvalidGameToken):
+    pass
+
+
+@dataclass(frozen=True)
+class GameAccessClaims:
+    token_id: str
+    game_ids: Tuple[int, ...]
+    order_id: str
+    expires_at: int
+
+    @property
+    def expires_at_datetime(self) -> datetime:
+        return datetime.utcfromtimestamp(self.expires_at)
+
+    def allows(self, game_id: int) -> bool:
+        return game_id in self.game_ids
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode((data + "=" * (-len(data) % 4)).encode("ascii"))
+
+
+def _order_revocation_id(order_id: str) -> str:
+    return f"order:{order_id}"
+
+
+class GameAccessTokens:
+    def __init__(self, secret: Optional[bytes] = None,
+                 cache_size: int = GAME_ACCESS_CACHE_SIZE, cache_ttl: float = GAME_ACCESS_CACHE_TTL):
+        self._secret = secret if secret is not None else _load_secret()
+        # token -> (klaim, revoked?) hasil verifikasi + cek Mongo terakhir
+        self._checked: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _sign(self, payload: bytes) -> str:
+        if not self._secret:
+            raise GameAccessNotConfigured("GAME_ACCESS_SECRET is not set")
+        return _b64encode(hmac.new(self._secret, payload, hashlib.sha256).digest())
+
+    # ------------------------------------------------------------------
+    # Issue / verify (CPU saja)
+    # ------------------------------------------------------------------
+    def issue(self, game_ids: Sequence[int], order_id: str,
+              ttl_seconds: Optional[float] = None) -> Tuple[str, GameAccessClaims]:
+        # tidak boleh melebihi GAME_ACCESS_TTL_HOURS: revokasi per order hanya hidup selama itu
+        ttl = min(ttl_seconds, GAME_ACCESS_TTL_HOURS * 3600) if ttl_seconds is not None \
+            else GAME_ACCESS_TTL_HOURS * 3600
+        claims = GameAccessClaims(
+            token_id=_b64encode(secrets.token_bytes(9)),
+            game_ids=tuple(int(g) for g in game_ids),
+            order_id=order_id,
+            expires_at=int(time.time() + ttl),
+        )
+        body = json.dumps(
+            {"t": claims.token_id, "g": list(claims.game_ids), "o": claims.order_id, "e": claims.expires_at},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        payload = _b64encode(body)
+        return f"{payload}.{self._sign(payload.encode('ascii'))}", claims
+
+    def verify(self, token: str) -> GameAccessClaims:
+        """Cek tanda tangan + expiry. Raise InvalidGameToken / GameAccessNotConfigured."""
+        try:
+            payload, signature = token.split(".")
+        except (AttributeError, ValueError):
+            raise InvalidGameToken("malformed token")
+        # token yang sah hanya berisi base64url; compare_digest menolak str non-ASCII (TypeError)
+        if not token.isascii():
+            raise InvalidGameToken("malformed token")
+        expected = self._sign(payload.encode("ascii"))
+        if not hmac.compare_digest(signature.encode("ascii"), expected.encode("ascii")):
+            raise InvalidGameToken("invalid signature")
+        try:
+            data = json.loads(_b64decode(payload))
+            claims = GameAccessClaims(
+                token_id=str(data["t"]),
+                game_ids=tuple(int(g) for g in data["g"]),
+                order_id=str(data["o"]),
+                expires_at=int(data["e"]),
+            )
+        except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+            raise InvalidGameToken("malformed token")
+        if claims.expires_at <= time.time():
+            raise InvalidGameToken("token expired")
+        return claims
+
+    # ------------------------------------------------------------------
+    # Revocation (Mongo, di-cache)
+    # ------------------------------------------------------------------
+    async def _is_revoked(self, db, claims: GameAccessClaims) -> bool:
+        doc = await db[REVOCATIONS_COLLECTION].find_one(
+            {"_id": {"$in": [claims.token_id, _order_revocation_id(claims.order_id)]}},
+            {"_id": 1},
+        )
+        return doc is not None
+
+    async def check(self, db, token: str) -> GameAccessClaims:
+        """
+        verify() + cek revokasi. Raise InvalidGameToken / RevokedGameToken.
+        Token yang sudah dicek disimpan di cache (klaim + status revokasi), jadi
+        reload berikutnya hanya lookup dict + cek expiry.
+        """
+        cached = self._checked.get(token)
+        if cached is None:
+            claims = self.verify(token)
+            revoked = db is not None and await self._is_revoked(db, claims)
+            self._checked[token] = (claims, revoked)
+        else:
+            claims, revoked = cached
+            if claims.expires_at <= time.time():
+                raise InvalidGameToken("token expired")
+        if revoked:
+            raise RevokedGameToken("token revoked")
+        return claims
+
+    async def revoke(self, db, *, token: Optional[str] = None, order_id: Optional[str] = None) -> List[str]:
+        """
+        Cabut satu token (butuh token lengkap agar expiry-nya diketahui) atau
+        semua token milik satu order. Entri revokasi dihapus TTL index
+        setelah token-nya pasti kedaluwarsa.
+        """
+        now = datetime.utcnow()
+        revoked: List[str] = []
+        if token:
+            claims = self.verify(token)
+            await db[REVOCATIONS_COLLECTION].update_one(
+                {"_id": claims.token_id},
+                {"$setOnInsert": {
+                    "orderId": claims.order_id,
+                    "revokedAt": now,
+                    "expiresAt": claims.expires_at_datetime,
+                }},
+                upsert=True,
+            )
+            self._checked[token] = (claims, True)
+            revoked.append(claims.token_id)
+        if order_id:
+            revocation_id = _order_revocation_id(order_id)
+            await db[REVOCATIONS_COLLECTION].update_one(
+                {"_id": revocation_id},
+                {
+                    "$set": {"revokedAt": now},
+                    # token yang diterbitkan sebelum revokasi paling lama hidup selama TTL
+                    "$max": {"expiresAt": datetime.utcfromtimestamp(time.time() + GAME_ACCESS_TTL_HOURS * 3600)},
+                    "$setOnInsert": {"orderId": order_id},
+                },
+                upsert=True,
+            )
+            # token lain dari order ini dicek ulang ke Mongo
+            self._checked.clear()
+            revoked.append(revocation_id)
+        return revoked
+
+
+def game_access_link(token: str) -> str:
+    return f"{FRONTEND_URL}/games/play?token={token}"
+
+
+game_access_tokens = GameAccessTokens()
@@ -0,0 +1,25 @@
+"""
+Helper HTTP caching (ETag / conditional request) yang dipakai beberapa route.
+"""
+import hashlib
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Cek header If-None-Match (bisa berisi beberapa tag, '*' atau prefix W/)."""
+    if not if_none_match or not etag:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def content_etag(content: bytes) -> str:
+    """Strong ETag dari isi response."""
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
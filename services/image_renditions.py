@@ -0,0 +1,245 @@
+"""
+Rendisi gambar (resize + format negotiation) untuk /api/proxy/image.
+
+Gambar halaman ebook (EbookPage.imageUrl) berukuran penuh; katalog mobile cukup
+versi kecil. Rendisi dibuat dengan Pillow di thread pool kecil tersendiri dan
+disimpan di disk per (url, ETag sumber, width, format, quality), jadi setiap
+kombinasi hanya dirender sekali per instance dan berubah bila gambar sumber
+berubah. Lebar dan quality di-snap ke beberapa preset agar jumlah varian
+terbatas; isi disk dibatasi PROXY_RENDITION_MAX_BYTES dengan eviksi LRU
+(indeks di memori, per proses).
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = Path(os.environ.get(
+    "PROXY_RENDITION_DIR", os.path.join(tempfile.gettempdir(), "ebookanak-renditions")
+))
+
+# Lebar di-snap ke daftar ini agar jumlah varian (dan isi disk) tetap terbatas
+RENDITION_WIDTHS = (160, 320, 480, 640, 800, 1080, 1280, 1600)
+# quality juga di-snap (q dari client bebas 1..100)
+QUALITY_PRESETS = (50, 65, 80, 90)
+DEFAULT_QUALITY = 80
+
+RENDITION_MAX_BYTES = int(os.environ.get("PROXY_RENDITION_MAX_BYTES", str(512 * 1024 * 1024)))
+# encode AVIF/WebP berat CPU: jangan pakai default thread pool bersama
+RENDER_WORKERS = int(os.environ.get("PROXY_RENDER_WORKERS", "2"))
+
+MEDIA_TYPES = {
+    "AVIF": "image/avif",
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+}
+
+_AVIF_SUPPORTED = features.check("avif")
+_WEBP_SUPPORTED = features.check("webp")
+
+
+def snap_width(width: Optional[int]) -> Optional[int]:
+    """Bulatkan ke atas ke lebar standar terdekat (None = ukuran asli)."""
+    if not width or width <= 0:
+        return None
+    for candidate in RENDITION_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return RENDITION_WIDTHS[-1]
+
+
+def snap_quality(quality: Optional[int]) -> int:
+    """Preset quality terdekat (seri: yang lebih tinggi)."""
+    if not quality:
+        return DEFAULT_QUALITY
+    return min(QUALITY_PRESETS, key=lambda preset: (abs(preset - quality), -preset))
+
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """
+    Pilih format modern dari header Accept.
+    None = pertahankan format sumber (JPEG tetap JPEG, lainnya PNG).
+    """
+    accept = (accept or "").lower()
+    if _AVIF_SUPPORTED and "image/avif" in accept:
+        return "AVIF"
+    if _WEBP_SUPPORTED and "image/webp" in accept:
+        return "WEBP"
+    return None
+
+
+def rendition_key(url: str, source_etag: str, width: Optional[int], fmt: Optional[str], quality: int) -> str:
+    raw = f"{url}|{source_etag}|{width or 0}|{fmt or 'orig'}|{quality}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def render(data: bytes, width: Optional[int], fmt: Optional[str], quality: int) -> Tuple[bytes, str]:
+    """Resize (tanpa upscale) dan encode ulang. Blocking — panggil via thread."""
+    with Image.open(io.BytesIO(data)) as source:
+        out_format = fmt or ("JPEG" if source.format == "JPEG" else "PNG")
+        image = ImageOps.exif_transpose(source)
+
+        if width and image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        if out_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif out_format in ("WEBP", "AVIF", "PNG") and image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        buffer = io.BytesIO()
+        if out_format == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=out_format, quality=quality)
+        return buffer.getvalue(), MEDIA_TYPES[out_format]
+
+
+_EXTENSIONS = {media_type.split("/")[-1]: media_type for media_type in MEDIA_TYPES.values()}
+
+
+class RenditionStore:
+    """
+    Cache rendisi di disk: <key>.<ext>, ditulis atomik (tmp + rename).
+    Indeks LRU (key -> media type, ukuran) ada di memori, dibangun sekali dari
+    isi direktori, sehingga lookup tidak menyentuh disk di event loop.
+    """
+
+    def __init__(self, directory: Path = RENDITION_DIR, max_bytes: int = RENDITION_MAX_BYTES,
+                 workers: int = RENDER_WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._index_loaded: Optional[asyncio.Task] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rendition")
+
+    def _path(self, key: str, media_type: str) -> Path:
+        return self.directory / f"{key}.{media_type.split('/')[-1]}"
+
+    def _scan(self) -> "OrderedDict[str, Tuple[str, int]]":
+        """Isi direktori, urut mtime (paling lama = paling dulu di-evict)."""
+        entries = []
+        if self.directory.is_dir():
+            for path in self.directory.iterdir():
+                media_type = _EXTENSIONS.get(path.suffix.lstrip("."))
+                if media_type is None:
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path.stem, media_type, stat.st_size))
+        entries.sort()
+        return OrderedDict((key, (media_type, size)) for _, key, media_type, size in entries)
+
+    async def _ensure_index(self) -> None:
+        if self._index_loaded is None:
+            self._index_loaded = asyncio.ensure_future(self._load_index())
+        await asyncio.shield(self._index_loaded)
+
+    async def _load_index(self) -> None:
+        try:
+            scanned = await asyncio.to_thread(self._scan)
+        except OSError as e:
+            logger.warning(f"Could not scan rendition directory {self.directory}: {e}")
+            return
+        # rendisi yang sudah ditulis selama scan berjalan tetap paling baru
+        scanned.update(self._index)
+        self._index = scanned
+        self.total_bytes = sum(size for _, size in self._index.values())
+        await self._evict()
+
+    def _unlink(self, paths) -> None:
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    async def _evict(self) -> None:
+        victims = []
+        while self.total_bytes > self.max_bytes and len(self._index) > 1:
+            key, (media_type, size) = self._index.popitem(last=False)
+            self.total_bytes -= size
+            victims.append(self._path(key, media_type))
+        if victims:
+            try:
+                await asyncio.to_thread(self._unlink, victims)
+            except OSError as e:
+                logger.warning(f"Could not evict renditions: {e}")
+
+    def _forget(self, key: str) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    async def lookup(self, key: str) -> Optional[Tuple[bytes, str]]:
+        await self._ensure_index()
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        media_type = entry[0]
+        try:
+            content = await asyncio.to_thread(self._path(key, media_type).read_bytes)
+        except OSError:
+            # dihapus dari luar (worker lain / tmp cleaner): render ulang
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        return content, media_type
+
+    def _write(self, key: str, content: bytes, media_type: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, media_type)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return path
+
+    async def _render_and_store(self, key: str, data: bytes, width, fmt, quality) -> Tuple[bytes, str]:
+        loop = asyncio.get_running_loop()
+        content, media_type = await loop.run_in_executor(self._executor, render, data, width, fmt, quality)
+        await self._ensure_index()
+        try:
+            await asyncio.to_thread(self._write, key, content, media_type)
+        except OSError as e:
+            # disk penuh/read-only: tetap layani hasil render dari memori
+            logger.warning(f"Could not persist rendition {key}: {e}")
+            return content, media_type
+        self._forget(key)
+        self._index[key] = (media_type, len(content))
+        self.total_bytes += len(content)
+        await self._evict()
+        return content, media_type
+
+    async def get_or_render(self, key: str, data: bytes, width, fmt, quality) -> Tuple[bytes, str]:
+        """Render sekali per key walau banyak request bersamaan."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render_and_store(key, data, width, fmt, quality))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+rendition_store = RenditionStore()
@@ -0,0 +1,230 @@
+"""
+Deklarasi semua index yang dibutuhkan query aplikasi + bootstrap saat startup.
+
+Sebelumnya index hanya dibuat oleh seed_db.py / update_phase1_database.py,
+jadi database yang tidak di-seed ulang (atau koleksi minigames /
+exclusive_ebooks) tidak punya index di `id`. `ensure_indexes` idempotent:
+index yang sudah ada dengan spesifikasi sama tidak dibuat ulang. Nama index
+mengikuti default pymongo ("field_1"), sama dengan yang dibuat skrip seed.
+
+`index_report` membandingkan deklarasi dengan index yang ada + `$indexStats`:
+index yang belum ada (missing), tidak dideklarasikan (undeclared) dan yang
+belum pernah dipakai sejak server Mongo start (unused).
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENTS_TTL_DAYS = int(os.environ.get("WEBHOOK_EVENTS_TTL_DAYS", "30"))
+# _id outbox = kunci idempotensi email per order: simpan minimal selama ledger webhook
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get("EMAIL_OUTBOX_RETENTION_DAYS", "30"))
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+    reason: str = ""
+
+    @property
+    def name(self) -> str:
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def model(self) -> IndexModel:
+        options: Dict[str, Any] = {"name": self.name}
+        if self.unique:
+            options["unique"] = True
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        return IndexModel(list(self.keys), **options)
+
+
+def _idx(collection: str, *fields: str, **options) -> IndexSpec:
+    return IndexSpec(collection, tuple((field, ASCENDING) for field in fields), **options)
+
+
+INDEXES: List[IndexSpec] = [
+    # katalog: find_one({"id": ...}), $in join di services/product_join.py
+    _idx("ebooks", "id", unique=True, reason="product lookup by id"),
+    _idx("ebooks", "category", reason="catalog filter"),
+    _idx("ebooks", "ageGroup", reason="catalog filter"),
+    _idx("minigames", "id", unique=True, reason="product lookup by id"),
+    _idx("exclusive_ebooks", "id", unique=True, reason="product lookup by id"),
+    # orders
+    _idx("orders", "orderId", unique=True, reason="webhook / outbox / status lookup"),
+    _idx("orders", "customerEmail", reason="order lookup by customer"),
+    # _id sebagai tie-breaker keyset bulk resend; prefix-nya melayani reconciler + sweeper
+    _idx("orders", "paymentStatus", "createdAt", "_id", reason="reconciliation, pending-order sweeper, bulk resend keyset"),
+    # payments (services/payment_events.py)
+    _idx("payments", "orderId", "createdAt", reason="payment history per order"),
+    _idx("payments", "midtransTransactionId", reason="lookup by Midtrans transaction"),
+    # email outbox claim query (services/email_outbox.py)
+    _idx("email_outbox", "status", "nextAttemptAt", reason="claim due jobs"),
+    _idx("email_outbox", "status", "leaseUntil", reason="reclaim expired leases"),
+    # hanya job terkirim yang punya sentAt; job failed tetap disimpan untuk diperiksa
+    _idx("email_outbox", "sentAt", expire_after_seconds=EMAIL_OUTBOX_RETENTION_DAYS * 86400,
+         reason="sent email retention (TTL)"),
+    # ledger idempotensi webhook cukup disimpan sebatas jendela retry Midtrans
+    _idx("webhook_events", "receivedAt", expire_after_seconds=WEBHOOK_EVENTS_TTL_DAYS * 86400,
+         reason="ledger retention (TTL)"),
+    # game access: dokumen counter token dihapus Mongo saat token kedaluwarsa
+    _idx("game_access_tokens", "tokenId", unique=True, reason="token lookup"),
+    _idx("game_access_tokens", "expiresAt", expire_after_seconds=0, reason="token expiry (TTL)"),
+    # entri revokasi tidak berguna lagi setelah token-nya kedaluwarsa
+    _idx("game_access_revocations", "expiresAt", expire_after_seconds=0, reason="revocation retention (TTL)"),
+]
+
+
+def _by_collection(specs: List[IndexSpec]) -> Dict[str, List[IndexSpec]]:
+    grouped: Dict[str, List[IndexSpec]] = defaultdict(list)
+    for spec in specs:
+        grouped[spec.collection].append(spec)
+    return grouped
+
+
+# IndexOptionsConflict / IndexKeySpecsConflict: index bernama sama sudah ada dengan opsi lain
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+async def _convert_to_ttl(db, spec: IndexSpec) -> None:
+    """Ubah index lama (non-TTL, mis. buatan update_phase1_database.py) jadi TTL via collMod."""
+    await db.command("collMod", spec.collection, index={
+        "name": spec.name,
+        "expireAfterSeconds": spec.expire_after_seconds,
+    })
+    logger.info(f"Index {spec.collection}.{spec.name} converted to TTL ({spec.expire_after_seconds}s)")
+
+
+async def _ensure_collection(db, collection: str, specs: List[IndexSpec]) -> Dict[str, str]:
+    try:
+        await db[collection].create_indexes([spec.model() for spec in specs])
+        return {spec.name: "ok" for spec in specs}
+    except OperationFailure:
+        # satu index gagal (mis. data duplikat untuk unique, atau opsi bentrok
+        # dengan index lama bernama sama): buat satu per satu agar sisanya tetap jadi
+        pass
+    results: Dict[str, str] = {}
+    for spec in specs:
+        try:
+            try:
+                await db[collection].create_indexes([spec.model()])
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES or spec.expire_after_seconds is None:
+                    raise
+                await _convert_to_ttl(db, spec)
+            results[spec.name] = "ok"
+        except OperationFailure as e:
+            results[spec.name] = f"error: {e.details.get('errmsg') if e.details else e}"
+            logger.error(f"Index {collection}.{spec.name} could not be created: {e}")
+    return results
+
+
+async def ensure_indexes(db, specs: Optional[List[IndexSpec]] = None) -> Dict[str, Dict[str, str]]:
+    """Buat semua index yang dideklarasikan; return {collection: {index: status}}."""
+    grouped = _by_collection(specs or INDEXES)
+    results = await asyncio.gather(*(
+        _ensure_collection(db, collection, collection_specs)
+        for collection, collection_specs in grouped.items()
+    ))
+    return dict(zip(grouped.keys(), results))
+
+
+async def _index_stats(db, collection: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(length=None)
+    except OperationFailure as e:
+        logger.warning(f"$indexStats unavailable for {collection}: {e}")
+        return {}
+    return {s["name"]: s for s in stats}
+
+
+async def _collection_report(db, collection: str, specs: List[IndexSpec]) -> Dict[str, Any]:
+    existing = await db[collection].index_information()
+    stats = await _index_stats(db, collection)
+    declared = {spec.name: spec for spec in specs}
+
+    missing = [{"name": name, "reason": spec.reason} for name, spec in declared.items() if name not in existing]
+    undeclared = [name for name in existing if name != "_id_" and name not in declared]
+    unused = []
+    for name, info in stats.items():
+        if name == "_id_":
+            continue
+        ops = (info.get("accesses") or {}).get("ops", 0)
+        if ops == 0:
+            since = (info.get("accesses") or {}).get("since")
+            unused.append({"name": name, "since": since.isoformat() if since else None})
+
+    return {
+        "indexes": {
+            name: {
+                "key": info.get("key"),
+                "unique": bool(info.get("unique")),
+                "ops": ((stats.get(name) or {}).get("accesses") or {}).get("ops"),
+                "declared": name in declared,
+            }
+            for name, info in existing.items()
+        },
+        "missing": missing,
+        "undeclared": undeclared,
+        "unused": unused,
+    }
+
+
+async def index_report(db) -> Dict[str, Any]:
+    grouped = _by_collection(INDEXES)
+    reports = await asyncio.gather(*(
+        _collection_report(db, collection, specs) for collection, specs in grouped.items()
+    ))
+    return dict(zip(grouped.keys(), reports))
+
+
+# ---------------------------------------------------------------------
+# Background bootstrap (startup)
+# ---------------------------------------------------------------------
+_task: Optional[asyncio.Task] = None
+last_result: Optional[Dict[str, Dict[str, str]]] = None
+
+
+async def _bootstrap(db) -> None:
+    global last_result
+    try:
+        last_result = await ensure_indexes(db)
+        failed = {
+            f"{collection}.{name}": status
+            for collection, statuses in last_result.items()
+            for name, status in statuses.items() if status != "ok"
+        }
+        if failed:
+            logger.error(f"Index bootstrap finished with errors: {failed}")
+        else:
+            logger.info(f"Index bootstrap ok ({len(INDEXES)} indexes)")
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {e}")
+
+
+def start_index_bootstrap(db) -> None:
+    """Jalankan ensure_indexes di background agar startup tidak menunggu build index."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_bootstrap(db))
+
+
+async def stop_index_bootstrap() -> None:
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
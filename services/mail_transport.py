@@ -0,0 +1,154 @@
+"""
+Transport SMTP asyncio-native (aiosmtplib) dengan pool sesi yang sudah login.
+
+Dipakai oleh routes/email_service.py (STARTTLS, port 587) dan
+services/notification_service.py (SSL, port 465). Pengiriman tidak pernah
+memblokir event loop dan tidak memakai default thread pool.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from email.message import Message
+from typing import List, Optional, Sequence
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 3))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', 100))
+SMTP_MAX_IDLE_SECONDS = float(os.environ.get('SMTP_MAX_IDLE_SECONDS', 240))
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+
+
+class _PooledConnection:
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        try:
+            await self.client.quit()
+        except Exception:
+            self.client.close()
+
+
+class SMTPNotConfigured(RuntimeError):
+    pass
+
+
+class AsyncSMTPTransport:
+    """
+    Pool sesi SMTP async yang sudah login, dipakai ulang untuk banyak pesan.
+    - maksimal `size` koneksi aktif sekaligus
+    - koneksi yang lama idle dicek dengan NOOP sebelum dipakai, reconnect bila mati
+    - koneksi ditutup setelah `max_messages` pesan (banyak server membatasi per sesi)
+    """
+
+    # koneksi yang baru dipakai tidak perlu dicek NOOP lagi
+    HEALTHCHECK_AFTER_SECONDS = 5
+
+    def __init__(self, host: Optional[str], port: int, username: Optional[str], password: Optional[str], *,
+                 use_tls: bool = False, start_tls: Optional[bool] = None,
+                 size: int = SMTP_POOL_SIZE, max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 max_idle: float = SMTP_MAX_IDLE_SECONDS, timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle: List[_PooledConnection] = []
+        self._slots = asyncio.Semaphore(size)
+        _transports.append(self)
+
+    def require_configured(self) -> None:
+        if not self.configured:
+            raise SMTPNotConfigured(f"SMTP is not configured for {self.host or '<no host>'}")
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.username and self.password)
+
+    async def _connect(self) -> _PooledConnection:
+        client = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        await client.login(self.username, self.password)
+        return _PooledConnection(client)
+
+    async def _is_healthy(self, conn: _PooledConnection) -> bool:
+        if not conn.client.is_connected:
+            return False
+        idle = time.monotonic() - conn.last_used
+        if idle > self.max_idle:
+            return False
+        if idle < self.HEALTHCHECK_AFTER_SECONDS:
+            return True
+        try:
+            response = await conn.client.noop()
+            return response.code == 250
+        except Exception:
+            return False
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            if await self._is_healthy(conn):
+                return conn
+            await conn.close()
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            conn = None
+            try:
+                conn = await self._acquire()
+                yield conn.client
+                conn.sent += 1
+                conn.last_used = time.monotonic()
+                if conn.sent >= self.max_messages:
+                    await conn.close()
+                else:
+                    self._idle.append(conn)
+            except BaseException:
+                # status sesi tidak jelas setelah error: jangan dikembalikan ke pool
+                if conn is not None:
+                    await conn.close()
+                raise
+
+    async def send_message(self, msg: Message, recipients: Optional[Sequence[str]] = None) -> None:
+        try:
+            async with self.connection() as client:
+                await client.send_message(msg, recipients=recipients)
+        except aiosmtplib.SMTPServerDisconnected:
+            # koneksi pool diputus server di antara health check dan kirim: coba sekali lagi
+            async with self.connection() as client:
+                await client.send_message(msg, recipients=recipients)
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._idle.pop().close()
+
+
+_transports: List[AsyncSMTPTransport] = []
+
+
+async def close_all_transports() -> None:
+    for transport in _transports:
+        try:
+            await transport.close()
+        except Exception as e:
+            logger.warning(f"Error closing SMTP transport {transport.host}: {e}")
@@ -1,9 +1,59 @@
-import midtransclient
+import asyncio
+import httpx
+import logging
 import os
 import hashlib
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+SNAP_BASE_URL = {
+    True: "https://app.midtrans.com",
+    False: "https://app.sandbox.midtrans.com",
+}
+CORE_API_BASE_URL = {
+    True: "https://api.midtrans.com",
+    False: "https://api.sandbox.midtrans.com",
+}
+
+# status order yang masih menunggu pembayaran (create_order menulis lowercase,
+# webhook menulis uppercase)
+PENDING_STATUSES = ("pending", "PENDING")
+# satu-satunya transisi yang sah setelah SUCCESS
+POST_SETTLEMENT_STATUSES = ("REFUND", "PARTIAL_REFUND", "CHARGEBACK", "PARTIAL_CHARGEBACK")
+
+
+def map_transaction_status(txn_status: Optional[str]) -> str:
+    """Map transaction_status Midtrans → paymentStatus aplikasi."""
+    if txn_status in ("settlement", "capture"):
+        return "SUCCESS"
+    return (txn_status or "pending").upper()
+
+
+def status_transition_filter(new_status: str) -> dict:
+    """
+    Filter paymentStatus untuk update bersyarat: hanya jika status berubah,
+    dan notifikasi yang datang terlambat (pending/expire setelah settlement)
+    tidak menurunkan order yang sudah SUCCESS.
+    """
+    if new_status == "SUCCESS" or new_status in POST_SETTLEMENT_STATUSES:
+        return {"$ne": new_status}
+    return {"$nin": [new_status, "SUCCESS"]}
+
+class MidtransAPIError(RuntimeError):
+    """Error dari API Midtrans; status_code = kode di body (bila ada) atau HTTP status."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Batas waktu & konkurensi ke Midtrans (detik / jumlah request bersamaan)
+MIDTRANS_TIMEOUT = float(os.environ.get('MIDTRANS_TIMEOUT', '15'))
+MIDTRANS_CONNECT_TIMEOUT = float(os.environ.get('MIDTRANS_CONNECT_TIMEOUT', '5'))
+MIDTRANS_MAX_CONCURRENCY = int(os.environ.get('MIDTRANS_MAX_CONCURRENCY', '20'))
+
 
 class MidtransService:
     def __init__(self):
@@ -12,23 +62,57 @@ class MidtransService:
         self.is_production = os.environ.get('MIDTRANS_IS_PRODUCTION', 'false').lower() == 'true'
         
         # Debug logging
-        import logging
-        logger = logging.getLogger(__name__)
         logger.info(f"Midtrans Init - Server Key: {self.server_key[:15]}... (len: {len(self.server_key)})")
         logger.info(f"Midtrans Init - Client Key: {self.client_key[:15]}... (len: {len(self.client_key)})")
         logger.info(f"Midtrans Init - Is Production: {self.is_production}")
         
-        # Initialize Snap API
-        self.snap = midtransclient.Snap(
-            is_production=self.is_production,
-            server_key=self.server_key,
-            client_key=self.client_key
-        )
+        self.snap_url = f"{SNAP_BASE_URL[self.is_production]}/snap/v1/transactions"
+        self.core_api_url = CORE_API_BASE_URL[self.is_production]
+        
+        # HTTP client async (keep-alive, pooled) dibuat lazy di event loop yang berjalan
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(MIDTRANS_MAX_CONCURRENCY)
     
-    def create_transaction(self, order_id: str, customer_name: str, customer_email: str, 
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                auth=(self.server_key, ''),
+                headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+                timeout=httpx.Timeout(MIDTRANS_TIMEOUT, connect=MIDTRANS_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=MIDTRANS_MAX_CONCURRENCY,
+                    max_keepalive_connections=MIDTRANS_MAX_CONCURRENCY,
+                ),
+            )
+        return self._client
+    
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        """
+        Request ke Midtrans dengan konkurensi terbatas.
+        Raise MidtransAPIError bila HTTP status / status_code di body >= 400.
+        """
+        async with self._semaphore:
+            response = await self._get_client().request(method, url, **kwargs)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        body_status = str(data.get('status_code', '') or '')
+        if response.status_code >= 400 or (body_status.isdigit() and int(body_status) >= 400):
+            messages = data.get('error_messages') or data.get('status_message') or response.text
+            code = int(body_status) if body_status.isdigit() and int(body_status) >= 400 else response.status_code
+            raise MidtransAPIError(code, f"Midtrans API error {code}: {messages}")
+        return data
+    
+    async def create_transaction(self, order_id: str, customer_name: str, customer_email: str, 
                           items: list, total: int, discount: int = 0, customer_phone: str = '') -> Dict[str, Any]:
         """
-        Create Midtrans Snap transaction
+        Create Midtrans Snap transaction (non-blocking, pooled HTTP client)
         """
         # Format items for Midtrans
         item_details = []
@@ -76,11 +160,9 @@ class MidtransService:
         }
         
         try:
-            import logging
-            logger = logging.getLogger(__name__)
             logger.info(f"Creating Midtrans transaction with params: {param}")
             
-            transaction = self.snap.create_transaction(param)
+            transaction = await self._request('POST', self.snap_url, json=param)
             
             logger.info(f"Midtrans response: {transaction}")
             
@@ -90,8 +172,6 @@ class MidtransService:
                 'redirect_url': transaction['redirect_url']
             }
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Midtrans transaction creation failed: {str(e)}")
             logger.error(f"Params sent: {param}")
             
@@ -109,17 +189,12 @@ class MidtransService:
         calculated_signature = hashlib.sha512(string_to_hash.encode('utf-8')).hexdigest()
         return calculated_signature == signature_key
     
-    def get_transaction_status(self, order_id: str) -> Dict[str, Any]:
+    async def get_transaction_status(self, order_id: str) -> Dict[str, Any]:
         """
-        Get transaction status from Midtrans
+        Get transaction status from Midtrans (reuses the pooled client)
         """
         try:
-            core_api = midtransclient.CoreApi(
-                is_production=self.is_production,
-                server_key=self.server_key,
-                client_key=self.client_key
-            )
-            status = core_api.transactions.status(order_id)
+            status = await self._request('GET', f"{self.core_api_url}/v2/{order_id}/status")
             return {
                 'success': True,
                 'data': status
@@ -127,5 +202,10 @@ class MidtransService:
         except Exception as e:
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'status_code': getattr(e, 'status_code', None),
             }
+
+
+# Instance bersama (satu pool koneksi per worker)
+midtrans_service = MidtransService()
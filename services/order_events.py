@@ -0,0 +1,139 @@
+"""
+Pub/sub in-process untuk perubahan status pembayaran order (SSE
+GET /api/orders/{order_id}/events).
+
+Penerbit di worker ini (webhook Midtrans, reconciler) memanggil publish()
+langsung setelah update berhasil. Perubahan dari worker lain (dan dari
+update_many sweeper order kedaluwarsa) masuk lewat satu change stream pada
+koleksi `orders` per worker, difilter di server hanya untuk update yang
+menyentuh `paymentStatus`. Event yang sama bisa datang dua kali (publish lokal
++ change stream); subscriber cukup mengabaikan status yang tidak berubah.
+Setiap publish juga meng-invalidate services/order_status_cache.py.
+
+Tanpa replica set (change stream tidak tersedia) `watching` bernilai False
+dan stream SSE kembali membaca status dari Mongo secara berkala.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get("ORDER_EVENTS_QUEUE_SIZE", "8"))
+ORDER_EVENTS_RETRY_SECONDS = float(os.environ.get("ORDER_EVENTS_RETRY_SECONDS", "5"))
+# stream SSE: komentar keep-alive, polling bila tanpa change stream, umur maksimum
+ORDER_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("ORDER_EVENTS_HEARTBEAT_SECONDS", "15"))
+ORDER_EVENTS_POLL_SECONDS = float(os.environ.get("ORDER_EVENTS_POLL_SECONDS", "5"))
+ORDER_EVENTS_MAX_SECONDS = float(os.environ.get("ORDER_EVENTS_MAX_SECONDS", "900"))
+
+# field order yang dikirim ke client (juga proyeksi change stream / find_one)
+ORDER_STATUS_FIELDS = ("orderId", "paymentStatus", "paidAt", "total")
+
+
+def order_status_event(doc: Dict[str, Any]) -> Dict[str, Any]:
+    event = {k: doc.get(k) for k in ORDER_STATUS_FIELDS}
+    if isinstance(event["paidAt"], datetime):
+        event["paidAt"] = event["paidAt"].isoformat()
+    return event
+
+
+class OrderEventBus:
+    def __init__(self, queue_size: int = ORDER_EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self.watching = False
+
+    # ------------------------------------------------------------------
+    # Subscribe / publish
+    # ------------------------------------------------------------------
+    def subscribe(self, order_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(order_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, order_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(order_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[order_id]
+
+    def publish(self, doc: Dict[str, Any]) -> int:
+        """
+        Status order berubah: buang entri cache GET /orders/{order_id}/status lalu
+        kirim ke subscriber SSE-nya; return jumlah subscriber.
+        """
+        from services.order_status_cache import order_status_cache
+
+        order_status_cache.invalidate(doc.get("orderId"))
+        queues = self._subscribers.get(doc.get("orderId"))
+        if not queues:
+            return 0
+        event = order_status_event(doc)
+        for queue in queues:
+            if queue.full():
+                # client lambat: hanya status terbaru yang penting
+                queue.get_nowait()
+            queue.put_nowait(event)
+        return len(queues)
+
+    def has_subscribers(self, order_id: str) -> bool:
+        return order_id in self._subscribers
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(q) for q in self._subscribers.values())
+
+    # ------------------------------------------------------------------
+    # Change stream (perubahan dari worker lain)
+    # ------------------------------------------------------------------
+    async def _watch(self, db) -> None:
+        pipeline = [
+            {"$match": {
+                "operationType": "update",
+                "updateDescription.updatedFields.paymentStatus": {"$exists": True},
+            }},
+            {"$project": {f"fullDocument.{k}": 1 for k in ORDER_STATUS_FIELDS}},
+        ]
+        started = False
+        while True:
+            try:
+                async with db.orders.watch(pipeline, full_document="updateLookup") as stream:
+                    if not started:
+                        logger.info("Order events change stream started")
+                    started = self.watching = True
+                    async for change in stream:
+                        doc = change.get("fullDocument")
+                        if doc:
+                            self.publish(doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.watching = False
+                if not started:
+                    # Mongo standalone tidak mendukung change stream
+                    logger.warning(f"Order events change stream unavailable, SSE falls back to polling: {e}")
+                    return
+                logger.warning(f"Order events change stream interrupted, retrying: {e}")
+                await asyncio.sleep(ORDER_EVENTS_RETRY_SECONDS)
+
+    def start_watch(self, db) -> None:
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch(db))
+
+    async def stop_watch(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        self.watching = False
+
+
+order_events = OrderEventBus()
@@ -0,0 +1,83 @@
+"""
+Sweeper order pending yang ditinggalkan.
+
+Order yang tidak pernah dibayar tetap `pending` selamanya (Snap kedaluwarsa
+tanpa selalu mengirim notifikasi). Sweeper menandainya `expired`
+(models.PaymentStatus.EXPIRED) dengan satu `update_many` di atas index
+(paymentStatus, createdAt), sehingga query order pending tetap kecil.
+
+Batas umur (PENDING_ORDER_TTL_HOURS) sengaja jauh di atas masa berlaku Snap
+dan interval reconciler, agar pembayaran yang webhook-nya hilang sempat
+direkonsiliasi dulu. Notifikasi settlement yang datang terlambat tetap
+mengubah order expired menjadi SUCCESS (lihat status_transition_filter).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from models import PaymentStatus
+from services.midtrans_service import PENDING_STATUSES
+from services.order_status_cache import order_status_cache
+
+logger = logging.getLogger(__name__)
+
+PENDING_ORDER_TTL_HOURS = float(os.environ.get("PENDING_ORDER_TTL_HOURS", "48"))
+ORDER_SWEEP_INTERVAL_SECONDS = float(os.environ.get("ORDER_SWEEP_INTERVAL_SECONDS", "3600"))
+
+
+async def expire_stale_orders(db, *, older_than_hours: float = PENDING_ORDER_TTL_HOURS) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    cutoff = now - timedelta(hours=older_than_hours)
+    result = await db.orders.update_many(
+        {"paymentStatus": {"$in": list(PENDING_STATUSES)}, "createdAt": {"$lt": cutoff}},
+        {"$set": {
+            "paymentStatus": PaymentStatus.EXPIRED.value,
+            "expiredAt": now,
+            "updatedAt": now,
+        }},
+    )
+    stats = {"expired": result.modified_count, "cutoff": cutoff.isoformat()}
+    if result.modified_count:
+        # worker lain: lewat change stream (OrderEventBus) atau TTL cache
+        order_status_cache.clear()
+        logger.info(f"Expired {result.modified_count} pending orders created before {cutoff}")
+    return stats
+
+
+# ---------------------------------------------------------------------
+# Background loop
+# ---------------------------------------------------------------------
+_task: Optional[asyncio.Task] = None
+
+
+async def _run_forever(db, interval: float) -> None:
+    while True:
+        try:
+            await expire_stale_orders(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Pending order sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_order_sweeper(db, interval: float = ORDER_SWEEP_INTERVAL_SECONDS) -> None:
+    global _task
+    if interval <= 0:
+        logger.info("Pending order sweeper disabled (ORDER_SWEEP_INTERVAL_SECONDS<=0)")
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run_forever(db, interval))
+
+
+async def stop_order_sweeper() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
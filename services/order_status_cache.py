@@ -0,0 +1,73 @@
+"""
+Cache TTL pendek untuk GET /api/orders/{order_id}/status (endpoint polling
+halaman checkout).
+
+Isi cache hanya proyeksi kecil (paymentStatus, paidAt, total), bukan
+dokumen order utuh. Entri di-invalidate saat status berubah: oleh
+OrderEventBus.publish (webhook Midtrans, reconciler, dan change stream dari
+worker lain) dan oleh sweeper order kedaluwarsa. ORDER_STATUS_CACHE_TTL
+membatasi umur entri bila invalidasi lintas worker tidak tersedia.
+Miss bersamaan untuk order yang sama digabung menjadi satu find_one.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+ORDER_STATUS_CACHE_SIZE = int(os.environ.get("ORDER_STATUS_CACHE_SIZE", "10000"))
+ORDER_STATUS_CACHE_TTL = float(os.environ.get("ORDER_STATUS_CACHE_TTL", "5"))
+
+ORDER_STATUS_PROJECTION = {"_id": 0, "paymentStatus": 1, "paidAt": 1, "total": 1}
+
+
+def _order_status(doc: Dict[str, Any]) -> Dict[str, Any]:
+    paid_at = doc.get("paidAt")
+    return {
+        "paymentStatus": doc.get("paymentStatus"),
+        "paidAt": paid_at.isoformat() if isinstance(paid_at, datetime) else paid_at,
+        "total": doc.get("total"),
+    }
+
+
+class OrderStatusCache:
+    def __init__(self, maxsize: int = ORDER_STATUS_CACHE_SIZE, ttl: float = ORDER_STATUS_CACHE_TTL):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # orderId -> find_one yang sedang berjalan. invalidate() melepasnya, sehingga
+        # hasil load yang dimulai sebelum perubahan tidak disimpan (per order).
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _load(self, db, order_id: str) -> Optional[Dict[str, Any]]:
+        doc = await db.orders.find_one({"orderId": order_id}, ORDER_STATUS_PROJECTION)
+        return _order_status(doc) if doc else None
+
+    def _loaded(self, order_id: str, future: asyncio.Future) -> None:
+        if self._inflight.get(order_id) is not future:
+            return  # di-invalidate selama load
+        del self._inflight[order_id]
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self._cache[order_id] = future.result()
+
+    async def get(self, db, order_id: str) -> Optional[Dict[str, Any]]:
+        """Status order (dict baru), atau None bila order tidak ada."""
+        status = self._cache.get(order_id)
+        if status is None:
+            future = self._inflight.get(order_id)
+            if future is None:
+                future = self._inflight[order_id] = asyncio.ensure_future(self._load(db, order_id))
+                future.add_done_callback(lambda f: self._loaded(order_id, f))
+            status = await asyncio.shield(future)
+        return dict(status) if status is not None else None
+
+    def invalidate(self, order_id: str) -> None:
+        self._cache.pop(order_id, None)
+        # pembaca berikutnya tidak ikut menunggu find_one yang dimulai sebelum perubahan
+        self._inflight.pop(order_id, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._inflight.clear()
+
+
+order_status_cache = OrderStatusCache()
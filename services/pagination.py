@@ -0,0 +1,35 @@
+"""
+Cursor keyset pagination (opaque, di atas field `id`).
+
+Cursor hanya menyimpan id terakhir yang sudah dikirim, jadi halaman berikutnya
+selalu `id > last_id` — tidak ada skip/offset yang makin lambat saat katalog
+membesar, dan penambahan item baru tidak menggeser halaman. Halamannya sendiri
+dipotong dari listing in-memory (CatalogCache.page_products).
+"""
+import base64
+import binascii
+import json
+from typing import Any, Optional
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: Any) -> str:
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Any]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return data["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        raise InvalidCursor("invalid cursor")
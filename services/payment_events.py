@@ -0,0 +1,185 @@
+"""
+Riwayat pembayaran append-only di koleksi `payments` (lihat models.Payment).
+
+Setiap notifikasi Midtrans (webhook maupun hasil rekonsiliasi) dicatat sebagai
+satu event. Event ditampung di memori lalu ditulis per batch dengan
+`insert_many`, sehingga webhook tidak menambah round-trip ke Mongo. Dokumen
+`orders` hanya menyimpan ringkasan kecil (`payment`), bukan payload mentah.
+
+_id event = "<orderId>:<transaction_status>:<transaction_id>" (sama dengan
+ledger webhook), jadi batch yang ditulis ulang setelah error tidak
+menghasilkan duplikat.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+PAYMENTS_COLLECTION = "payments"
+
+PAYMENT_EVENTS_BATCH_SIZE = int(os.environ.get("PAYMENT_EVENTS_BATCH_SIZE", "100"))
+PAYMENT_EVENTS_FLUSH_SECONDS = float(os.environ.get("PAYMENT_EVENTS_FLUSH_SECONDS", "1"))
+# batas buffer bila Mongo tidak bisa ditulis untuk waktu lama
+PAYMENT_EVENTS_MAX_BUFFER = int(os.environ.get("PAYMENT_EVENTS_MAX_BUFFER", "10000"))
+
+DUPLICATE_KEY = 11000
+
+
+def payment_event_id(order_id: str, txn_status: Optional[str], transaction_id: Optional[str]) -> str:
+    return f"{order_id}:{txn_status or '-'}:{transaction_id or '-'}"
+
+
+def _gross_amount(value: Any) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _transaction_time(value: Any) -> Optional[datetime]:
+    # format Midtrans "YYYY-MM-DD HH:MM:SS" (WIB)
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def payment_summary(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Ringkasan kecil untuk orders.payment (pengganti orders.midtransPayload)."""
+    return {
+        "transactionId": payload.get("transaction_id"),
+        "transactionStatus": payload.get("transaction_status"),
+        "paymentType": payload.get("payment_type"),
+        "grossAmount": _gross_amount(payload.get("gross_amount")),
+        "fraudStatus": payload.get("fraud_status"),
+        "transactionTime": _transaction_time(payload.get("transaction_time")),
+    }
+
+
+def payment_event(payload: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Dokumen `payments` dengan field models.Payment + payload mentah."""
+    order_id = payload.get("order_id")
+    return {
+        "_id": payment_event_id(order_id, payload.get("transaction_status"), payload.get("transaction_id")),
+        "orderId": order_id,
+        "midtransTransactionId": payload.get("transaction_id"),
+        "transactionStatus": payload.get("transaction_status"),
+        "paymentType": payload.get("payment_type"),
+        "grossAmount": _gross_amount(payload.get("gross_amount")),
+        "transactionTime": _transaction_time(payload.get("transaction_time")),
+        "fraudStatus": payload.get("fraud_status"),
+        "webhookData": payload,
+        "source": source,
+        "createdAt": datetime.utcnow(),
+    }
+
+
+class PaymentEventWriter:
+    """
+    Buffer + flusher background. Flush saat buffer mencapai batch_size atau
+    setiap flush_interval detik, dan sekali lagi saat shutdown.
+    """
+
+    def __init__(self, batch_size: int = PAYMENT_EVENTS_BATCH_SIZE,
+                 flush_interval: float = PAYMENT_EVENTS_FLUSH_SECONDS,
+                 max_buffer: int = PAYMENT_EVENTS_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._db = None
+        self._buffer: List[Dict[str, Any]] = []
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, event: Dict[str, Any]) -> None:
+        self._buffer.append(event)
+        if len(self._buffer) > self.max_buffer:
+            dropped = len(self._buffer) - self.max_buffer
+            del self._buffer[:dropped]
+            logger.error(f"Payment event buffer full, dropped {dropped} oldest events")
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    def record(self, payload: Dict[str, Any], source: str) -> None:
+        self.add(payment_event(payload, source))
+
+    async def flush(self) -> int:
+        """Tulis semua event yang tertampung; return jumlah yang tersimpan."""
+        if self._db is None:
+            return 0
+        async with self._lock:
+            written = 0
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:len(batch)]
+                try:
+                    result = await self._db[PAYMENTS_COLLECTION].insert_many(batch, ordered=False)
+                    written += len(result.inserted_ids)
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    failed = [batch[err["index"]] for err in errors if err.get("code") != DUPLICATE_KEY]
+                    written += e.details.get("nInserted", 0)
+                    if failed:
+                        # kembalikan ke depan buffer, coba lagi di flush berikutnya
+                        self._buffer[:0] = failed
+                        logger.error(f"Failed to write {len(failed)} payment events: {errors[0].get('errmsg')}")
+                        break
+                except asyncio.CancelledError:
+                    # dibatalkan saat shutdown: batch ditulis ulang oleh flush terakhir
+                    self._buffer[:0] = batch
+                    raise
+                except Exception as e:
+                    self._buffer[:0] = batch
+                    logger.error(f"Failed to write payment events: {e}")
+                    break
+            return written
+
+    async def _run(self) -> None:
+        while True:
+            # asyncio.timeout (bukan wait_for): cancel saat shutdown tidak tertelan
+            # walau bersamaan dengan timeout interval yang pendek
+            try:
+                async with asyncio.timeout(self.flush_interval):
+                    await self._full.wait()
+            except TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Payment event flusher error: {e}")
+
+    def start(self, db) -> None:
+        self._db = db
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def history(self, db, order_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        return await db[PAYMENTS_COLLECTION].find(
+            {"orderId": order_id}, {"webhookData": 0}
+        ).sort("createdAt", 1).limit(limit).to_list(length=limit)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        written = await self.flush()
+        if self._buffer:
+            logger.error(f"{len(self._buffer)} payment events not written on shutdown")
+        elif written:
+            logger.info(f"Flushed {written} payment events on shutdown")
+
+
+payment_events = PaymentEventWriter()
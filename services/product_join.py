@@ -0,0 +1,115 @@
+"""
+Join item order -> dokumen produk (ebooks, minigames, exclusive_ebooks).
+
+Dipakai bersama oleh routes/orders.py (checkout) dan routes/webhooks.py
+(email setelah bayar). Semua item satu order (atau banyak order sekaligus)
+di-resolve dengan paling banyak satu query $in per koleksi, atau langsung
+dari catalog cache bila sudah termuat.
+"""
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.catalog_cache import CATALOG_COLLECTIONS, catalog_cache, normalize_product_type
+
+PRODUCT_TYPES = tuple(CATALOG_COLLECTIONS)  # ('ebook', 'minigame', 'ebook_exclusive')
+
+# urutan fallback bila productType item tidak konsisten dengan koleksinya
+FALLBACK_ORDER = ("ebook", "minigame", "ebook_exclusive")
+
+ProductsByType = Dict[str, Dict[int, Dict[str, Any]]]
+
+
+async def fetch_products_by_type(db, ids_by_type: Dict[str, Iterable[int]]) -> ProductsByType:
+    """
+    Ambil produk per productType dengan satu query {"id": {"$in": [...]}}
+    per koleksi; query antar koleksi dijalankan bersamaan.
+    Hasil: {productType: {id: doc}}
+    """
+    async def _fetch(product_type: str, ids: List[int]):
+        collection = db[CATALOG_COLLECTIONS[normalize_product_type(product_type)]]
+        docs = await collection.find({"id": {"$in": ids}}, {"_id": 0}).to_list(length=None)
+        return product_type, {d["id"]: d for d in docs}
+
+    wanted = {t: sorted(set(ids)) for t, ids in ids_by_type.items()}
+    results = await asyncio.gather(*(_fetch(t, ids) for t, ids in wanted.items() if ids))
+    return dict(results)
+
+
+def _item_ids(orders: Iterable[Dict[str, Any]]) -> List[int]:
+    ids = set()
+    for order in orders:
+        for it in order.get("items", []) or []:
+            product_id = (it or {}).get("ebookId")
+            if product_id:
+                ids.add(product_id)
+    return sorted(ids)
+
+
+def _from_cache(ids: List[int]) -> Optional[ProductsByType]:
+    if not catalog_cache.is_fresh:
+        return None
+    return {
+        t: {i: doc for i in ids if (doc := catalog_cache.get_document(t, i)) is not None}
+        for t in PRODUCT_TYPES
+    }
+
+
+def _join_item(it: Dict[str, Any], products: ProductsByType) -> Optional[Dict[str, Any]]:
+    """
+    Map ke kunci seragam untuk email & Game Access:
+      - product_type: 'ebook' | 'minigame' | 'ebook_exclusive'
+      - file_url: file_url | driveDownloadLink
+      - external_url: external_url | gameUrl
+    """
+    product_id = (it or {}).get("ebookId")
+    ptype = (it or {}).get("productType") or "ebook"
+    if not product_id:
+        return None
+
+    # cari sesuai type dulu, lalu fallback jika type tidak konsisten
+    doc = products.get(normalize_product_type(ptype), {}).get(product_id)
+    if not doc:
+        for fallback in FALLBACK_ORDER:
+            doc = products.get(fallback, {}).get(product_id)
+            if doc:
+                break
+    if not doc:
+        return None
+
+    return {
+        "id": doc.get("id"),
+        "title": doc.get("title"),
+        "product_type": ptype if ptype in PRODUCT_TYPES
+                             else ("minigame" if doc.get("external_url") or doc.get("gameUrl") else "ebook"),
+        "file_url": doc.get("file_url") or doc.get("driveDownloadLink"),
+        "external_url": doc.get("external_url") or doc.get("gameUrl"),
+    }
+
+
+async def resolve_products_for_orders(db, orders: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Join produk untuk banyak order sekaligus.
+    Hasil: {orderId: [product, ...]}
+    """
+    ids = _item_ids(orders)
+    if not ids:
+        return {o.get("orderId"): [] for o in orders}
+
+    products = _from_cache(ids)
+    if products is None:
+        # semua id dicari di ketiga koleksi sekaligus -> fallback gratis, maks 3 query
+        products = await fetch_products_by_type(db, {t: ids for t in PRODUCT_TYPES})
+
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for order in orders:
+        joined = (_join_item(it, products) for it in order.get("items", []) or [])
+        out[order.get("orderId")] = [p for p in joined if p]
+    return out
+
+
+async def resolve_order_products(db, order: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join produk untuk satu order (lihat resolve_products_for_orders)."""
+    if db is None or not order:
+        return []
+    joined = await resolve_products_for_orders(db, [order])
+    return joined.get(order.get("orderId"), [])
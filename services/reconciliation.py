@@ -0,0 +1,214 @@
+"""
+Rekonsiliasi status pembayaran: menyembuhkan order yang webhook-nya hilang.
+
+Job memindai `orders` yang masih pending, mengecek status Midtrans secara
+paralel (dibatasi konkurensi + rate limit), lalu menerapkan semua transisi
+dengan satu `bulk_write`. Order yang ternyata sudah dibayar diantrikan ke
+email outbox seperti alur webhook.
+
+Order yang sudah dicek tapi tetap pending diberi `reconcileCheckedAt` dan
+baru dicek lagi setelah RECONCILE_RECHECK_SECONDS, sehingga order Snap yang
+ditinggalkan (Midtrans 404) tidak memenuhi batch setiap putaran dan menutupi
+order baru. Order 404 yang sudah melewati masa berlaku Snap ditandai expired.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from services.email_outbox import email_outbox
+from models import PaymentStatus
+from services.midtrans_service import PENDING_STATUSES, MidtransService, map_transaction_status
+from services.order_events import ORDER_STATUS_FIELDS, order_events
+from services.order_status_cache import order_status_cache
+from services.payment_events import payment_events, payment_summary
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get("RECONCILE_INTERVAL_SECONDS", "900"))
+RECONCILE_BATCH_SIZE = int(os.environ.get("RECONCILE_BATCH_SIZE", "500"))
+RECONCILE_CONCURRENCY = int(os.environ.get("RECONCILE_CONCURRENCY", "5"))
+RECONCILE_RATE_PER_SECOND = float(os.environ.get("RECONCILE_RATE_PER_SECOND", "10"))
+# order yang baru dibuat biasanya masih di halaman Snap; jangan dicek dulu
+RECONCILE_MIN_AGE_SECONDS = float(os.environ.get("RECONCILE_MIN_AGE_SECONDS", "300"))
+# order yang sudah dicek dan masih pending: tunggu sebelum dicek ulang
+RECONCILE_RECHECK_SECONDS = float(os.environ.get("RECONCILE_RECHECK_SECONDS", "3600"))
+# transaksi tidak dikenal Midtrans (404) setelah masa berlaku Snap -> expired
+RECONCILE_NOT_FOUND_EXPIRE_HOURS = float(os.environ.get("RECONCILE_NOT_FOUND_EXPIRE_HOURS", "24"))
+
+
+class RateLimiter:
+    """Jarak minimum antar request (token bucket sederhana tanpa burst)."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _publish_status_changes(db, order_ids: List[str]) -> None:
+    """Kabari stream SSE di worker ini (satu query, hanya order yang sedang ditonton)."""
+    for order_id in order_ids:
+        order_status_cache.invalidate(order_id)
+    watched = [order_id for order_id in order_ids if order_events.has_subscribers(order_id)]
+    if not watched:
+        return
+    projection = {"_id": 0, **{k: 1 for k in ORDER_STATUS_FIELDS}}
+    async for doc in db.orders.find({"orderId": {"$in": watched}}, projection):
+        order_events.publish(doc)
+
+
+async def reconcile_pending_orders(
+    db,
+    midtrans: MidtransService,
+    *,
+    limit: int = RECONCILE_BATCH_SIZE,
+    min_age_seconds: float = RECONCILE_MIN_AGE_SECONDS,
+) -> Dict[str, Any]:
+    started = datetime.utcnow()
+    cutoff = started - timedelta(seconds=min_age_seconds)
+    pending = await db.orders.find(
+        {
+            "paymentStatus": {"$in": list(PENDING_STATUSES)},
+            "createdAt": {"$lte": cutoff},
+            "$or": [
+                {"reconcileCheckedAt": {"$exists": False}},
+                {"reconcileCheckedAt": {"$lte": started - timedelta(seconds=RECONCILE_RECHECK_SECONDS)}},
+            ],
+        },
+        {"_id": 0, "orderId": 1, "paymentStatus": 1, "createdAt": 1},
+    ).sort("createdAt", 1).limit(limit).to_list(length=limit)
+
+    stats: Dict[str, Any] = {
+        "checked": len(pending), "updated": 0, "paid": 0, "expired": 0,
+        "unchanged": 0, "not_found": 0, "errors": 0,
+    }
+    if not pending:
+        return stats
+
+    limiter = RateLimiter(RECONCILE_RATE_PER_SECOND)
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    async def _check(order: Dict[str, Any]):
+        async with semaphore:
+            await limiter.wait()
+            return order, await midtrans.get_transaction_status(order["orderId"])
+
+    results = await asyncio.gather(*(_check(o) for o in pending))
+
+    now = datetime.utcnow()
+    ops: List[UpdateOne] = []
+    paid: List[str] = []
+    changed: List[str] = []
+    still_pending: List[str] = []
+    not_found_cutoff = now - timedelta(hours=RECONCILE_NOT_FOUND_EXPIRE_HOURS)
+    for order, result in results:
+        if not result.get("success"):
+            if result.get("status_code") != 404:
+                stats["errors"] += 1
+            elif order.get("createdAt") and order["createdAt"] <= not_found_cutoff:
+                # transaksi tidak pernah dibuat di Snap dan token Snap sudah kedaluwarsa
+                ops.append(UpdateOne(
+                    {"orderId": order["orderId"], "paymentStatus": {"$in": list(PENDING_STATUSES)}},
+                    {"$set": {"paymentStatus": PaymentStatus.EXPIRED.value, "expiredAt": now, "updatedAt": now}},
+                ))
+                changed.append(order["orderId"])
+                stats["expired"] += 1
+                continue
+            else:
+                # masih di halaman Snap (belum memilih metode bayar)
+                stats["not_found"] += 1
+            still_pending.append(order["orderId"])
+            continue
+        data = result["data"]
+        new_status = map_transaction_status(data.get("transaction_status"))
+        if new_status.lower() == (order.get("paymentStatus") or "").lower():
+            stats["unchanged"] += 1
+            still_pending.append(order["orderId"])
+            continue
+        ops.append(UpdateOne(
+            # hanya jika masih pending: jangan menimpa hasil webhook yang datang duluan
+            {"orderId": order["orderId"], "paymentStatus": {"$in": list(PENDING_STATUSES)}},
+            {
+                "$set": {
+                    "paymentStatus": new_status,
+                    "payment": payment_summary(data),
+                    "paidAt": now if new_status == "SUCCESS" else None,
+                    "updatedAt": now,
+                },
+                "$unset": {"midtransPayload": ""},
+            },
+        ))
+        changed.append(order["orderId"])
+        payment_events.record(data, source="reconciliation")
+        if new_status == "SUCCESS":
+            paid.append(order["orderId"])
+
+    if ops:
+        result = await db.orders.bulk_write(ops, ordered=False)
+        stats["updated"] = result.modified_count
+        await _publish_status_changes(db, changed)
+    if still_pending:
+        await db.orders.update_many(
+            {"orderId": {"$in": still_pending}, "paymentStatus": {"$in": list(PENDING_STATUSES)}},
+            {"$set": {"reconcileCheckedAt": now}},
+        )
+    if paid:
+        stats["paid"] = len(paid)
+        # outbox idempotent per orderId: aman bila webhook juga sudah mengantrikan
+        for order_id in paid:
+            await email_outbox.enqueue_order_email(db, order_id)
+
+    logger.info(f"Payment reconciliation: {stats}")
+    return stats
+
+
+# ---------------------------------------------------------------------
+# Background loop
+# ---------------------------------------------------------------------
+_task: Optional[asyncio.Task] = None
+
+
+async def _run_forever(db, midtrans: MidtransService, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_pending_orders(db, midtrans)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Payment reconciliation failed: {e}")
+
+
+def start_reconciler(db, midtrans: MidtransService, interval: float = RECONCILE_INTERVAL_SECONDS) -> None:
+    global _task
+    if interval <= 0:
+        logger.info("Payment reconciliation loop disabled (RECONCILE_INTERVAL_SECONDS<=0)")
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run_forever(db, midtrans, interval))
+
+
+async def stop_reconciler() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,120 @@
+"""
+Seeding katalog in-process (pengganti subprocess seed_db.py / seed_minigames.py /
+seed_exclusive_ebooks.py).
+
+Data tetap didefinisikan di skrip seed (sumber tunggal); modul ini hanya
+mengimpor list datanya lalu menulis ketiga koleksi secara paralel dengan
+`insert_many` per batch memakai client Motor milik server, tanpa interpreter
+Python tambahan dan tanpa memblokir event loop. Index dibuat oleh
+services/indexes.py.
+"""
+import asyncio
+import copy
+import importlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEED_BATCH_SIZE = int(os.environ.get("SEED_BATCH_SIZE", "100"))
+
+# koleksi -> (modul skrip seed, nama variabel data)
+SEED_SOURCES: Dict[str, Tuple[str, str]] = {
+    "ebooks": ("seed_db", "ebooks_data"),
+    "minigames": ("seed_minigames", "minigames_data"),
+    "exclusive_ebooks": ("seed_exclusive_ebooks", "exclusive_ebooks_data"),
+}
+
+
+def load_seed_data(collection: str) -> List[Dict[str, Any]]:
+    module_name, attr = SEED_SOURCES[collection]
+    data = getattr(importlib.import_module(module_name), attr)
+    # insert_many menambah `_id` ke dict: jangan ubah list milik modul seed
+    return copy.deepcopy(data)
+
+
+async def seed_collection(db, collection: str, *, replace: bool = False,
+                          batch_size: int = SEED_BATCH_SIZE) -> Dict[str, Any]:
+    started = time.monotonic()
+    coll = db[collection]
+    existing = await coll.count_documents({})
+    if existing and not replace:
+        return {"status": "skipped", "existing": existing}
+
+    docs = load_seed_data(collection)
+    deleted = (await coll.delete_many({})).deleted_count if existing else 0
+
+    inserted = 0
+    for start in range(0, len(docs), batch_size):
+        result = await coll.insert_many(docs[start:start + batch_size], ordered=False)
+        inserted += len(result.inserted_ids)
+        logger.info(f"Seeding {collection}: {inserted}/{len(docs)}")
+
+    return {
+        "status": "seeded",
+        "deleted": deleted,
+        "inserted": inserted,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+async def seed_catalog(db, *, replace: bool = False,
+                       collections: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Seed koleksi katalog secara paralel.
+    replace=False: hanya koleksi yang masih kosong (auto-seed saat startup).
+    replace=True: kosongkan lalu isi ulang (endpoint admin).
+    """
+    names = collections or list(SEED_SOURCES)
+
+    async def _seed(name: str):
+        try:
+            return name, await seed_collection(db, name, replace=replace)
+        except Exception as e:
+            logger.error(f"Seeding {name} failed: {e}")
+            return name, {"status": "error", "error": str(e)}
+
+    started = time.monotonic()
+    results = dict(await asyncio.gather(*(_seed(name) for name in names)))
+    seeded = {name: r for name, r in results.items() if r["status"] != "skipped"}
+    if seeded:
+        logger.info(f"Catalog seed finished in {time.monotonic() - started:.2f}s: {seeded}")
+    return results
+
+
+# ---------------------------------------------------------------------
+# Auto-seed background (startup)
+# ---------------------------------------------------------------------
+_task: Optional[asyncio.Task] = None
+
+
+async def _auto_seed(db) -> None:
+    from services.catalog_cache import catalog_cache
+
+    results = await seed_catalog(db)
+    if any(r["status"] == "seeded" for r in results.values()):
+        # cache sudah di-warm saat koleksi masih kosong
+        try:
+            await catalog_cache.reload(db)
+        except Exception as e:
+            catalog_cache.invalidate()
+            logger.error(f"Catalog cache reload after seed failed: {e}")
+
+
+def start_auto_seed(db) -> None:
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_auto_seed(db))
+
+
+async def stop_auto_seed() -> None:
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None